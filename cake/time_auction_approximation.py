@@ -19,6 +19,7 @@ from fairpy import Allocation
 import random, logging
 from typing import *
 from networkx import *
+import networkx as nx
 from math import *
 
 logger = logging.getLogger(__name__)
@@ -60,6 +61,16 @@ def equally_sized_pieces(agents: List[Agent], piece_size: float) -> Allocation:
     Alice gets {(2, 5)} with value 3.
     Bob gets {(0, 3)} with value 9.
     <BLANKLINE>
+
+    With a single agent, the agent gets its most valuable piece:
+    >>> equally_sized_pieces([Bob], 3 / 5)
+    Bob gets {(0, 3)} with value 9.
+    <BLANKLINE>
+
+    A single agent who values every piece at 0 gets an empty piece:
+    >>> equally_sized_pieces([PiecewiseConstantAgent([0, 0, 0], "Zed")], 1 / 3)
+    Zed gets {} with value 0.
+    <BLANKLINE>
     """
     # > Bob gets {(0, 3)} with value 9.00
 
@@ -90,6 +101,18 @@ def equally_sized_pieces(agents: List[Agent], piece_size: float) -> Allocation:
     normalize_partitions_0_l = [(int(p[0] * length), int(p[1] * length)) for p in partition_0_l]
     normalize_partitions_delta_l = [(int(p[0] * length), int(p[1] * length)) for p in partition_delta_l]
 
+    if num_of_agents == 1:
+        # A maximum-weight matching of a single agent is its most valuable piece, so the graphs are not needed.
+        agent = agents[0]
+        best_piece, best_value = None, 0
+        for piece in normalize_partitions_0_l + normalize_partitions_delta_l:
+            value = agent.eval(start=piece[0], end=piece[1])
+            if value > best_value:   # as below, the partition P_d_l is chosen only if it is strictly heavier.
+                best_piece, best_value = piece, value
+        if best_piece is None:   # no piece has a positive value, so the agent gets an empty piece.
+            return Allocation([agent], [[]])
+        return Allocation([agent], [[best_piece]])
+
     # Evaluating the pieces of the partition for every agent there is
     logger.info("For each piece (in both partitions) and agent: compute the agent's value of the piece.")
     evaluations = {}
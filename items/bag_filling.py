@@ -12,6 +12,11 @@ from fairpy import Allocation, valuations
 from typing import List
 import numpy as np
 
+try:
+	from numba import njit
+except ImportError:  # numba is optional; without it, bags are filled with numpy operations.
+	njit = None
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -19,6 +24,36 @@ logger = logging.getLogger(__name__)
 #####################
 
 
+def _fill_bag(values:np.ndarray, thresholds:np.ndarray, bag_values:np.ndarray, remaining_mask:np.ndarray, objects:np.ndarray)->(int, int):
+	"""
+	The inner loop of Bag.fill: append objects in order until a remaining agent is willing to accept the bag.
+	Compiled with numba when it is installed.
+	:param bag_values: the current value of the bag for each agent; updated in place.
+	:return (willing_agent, k): the smallest willing agent index, and the index in `objects` of the last appended object;
+	 or (-1, -1) if all objects were appended and no remaining agent is willing.
+
+	>>> bag_values = np.zeros(2)
+	>>> _fill_bag(np.array([[1.,2,3],[6,5,4]]), np.array([10.,10]), bag_values, np.array([True,True]), np.array([0,1,2]))
+	(1, 1)
+	>>> bag_values
+	array([ 3., 11.])
+	"""
+	n = values.shape[0]
+	for k in range(objects.size):
+		o = objects[k]
+		for i in range(n):
+			bag_values[i] += values[i, o]
+		for i in range(n):
+			if remaining_mask[i] and bag_values[i] >= thresholds[i]:
+				return i, k
+	return -1, -1
+
+_fill_bag_compiled = njit(cache=True)(_fill_bag) if njit is not None else None
+
+
+#####################
+
+
 class Bag:
 	"""
 	represents a bag for objects. 
@@ -56,14 +91,23 @@ class Bag:
 		"""
 		self.values = valuations.matrix_from(values)
 		self.thresholds = thresholds
+		self._thresholds = np.asarray(thresholds, dtype=float)
+		# A column-major float copy of the values, so that appending an object adds a single contiguous column:
+		self._value_matrix = np.asfortranarray(self.values._v, dtype=float)
+		self.map_agent_to_bag_value = np.zeros(self.values.num_of_agents, dtype=self._value_matrix.dtype)
+		self._ready = np.zeros(self.values.num_of_agents, dtype=bool)
+		self._was_ready = np.zeros(self.values.num_of_agents, dtype=bool)
+		self._newly_ready = np.zeros(self.values.num_of_agents, dtype=bool)
 		self.reset()
 
 	def reset(self): 
 		"""
 		Empty the bag.
 		"""
-		self.objects = []
-		self.map_agent_to_bag_value = np.zeros(self.values.num_of_agents)
+		self.objects = []   # a new list, since the previous one may have been given to an agent as its bundle.
+		self.map_agent_to_bag_value.fill(0)
+		self._ready.fill(False)
+		self._update_ready()
 		logger.info("Starting an empty bag. %d agents and %d objects.", self.values.num_of_agents, self.values.num_of_objects)
 
 	def append(self, object:int):
@@ -76,26 +120,56 @@ class Bag:
 			return
 		logger.info("   Appending object %s.", object)
 		self.objects.append(object)
-		for agent in self.values.agents():
-			self.map_agent_to_bag_value[agent] += self.values[agent][object]
+		self.map_agent_to_bag_value += self._value_matrix[:, object]
+		self._update_ready()
 		logger.debug("      Bag values: %s.", self.map_agent_to_bag_value)
 
+	def _update_ready(self):
+		"""
+		Recompute which agents are willing to accept the bag, and which of them became willing by the last update.
+		"""
+		# The buffers are swapped and overwritten in place, so no arrays are allocated per append.
+		(self._was_ready, self._ready) = (self._ready, self._was_ready)
+		np.greater_equal(self.map_agent_to_bag_value, self._thresholds, out=self._ready)
+		np.greater(self._ready, self._was_ready, out=self._newly_ready)   # for booleans, a>b means a and not b.
+
 	def willing_agent(self, remaining_agents)->int:
 		"""
 		:return the index of an arbitrary agent, from the list of remaining agents, who is willing to accept the bag 
 		 (i.e., the bag's value is above the agent's threshold).
 		 If no remaining agent is willing to accept the bag, None is returned.
 		"""
-		for agent in remaining_agents:
-			logger.debug("      Checking if agent %d is willing to take the bag", agent)
-			if self.map_agent_to_bag_value[agent] >= self.thresholds[agent]:
-				return agent
-		return None
+		return self._willing_agent_in_mask(self._agents_mask(remaining_agents))
+
+	def _agents_mask(self, agents)->np.ndarray:
+		"""
+		:return a boolean array, in which the entries of the given agents are True.
+		 If the given agents are already a boolean mask, they are returned as-is.
+		"""
+		if isinstance(agents, np.ndarray) and agents.dtype==bool:
+			return agents
+		mask = np.zeros(self.values.num_of_agents, dtype=bool)
+		mask[list(agents)] = True
+		return mask
+
+	def _willing_agent_in_mask(self, remaining_mask:np.ndarray, only_newly_ready:bool=False)->int:
+		"""
+		:return the smallest agent index, among the agents marked in remaining_mask, who is willing to accept the bag; 
+		 or None if there is no such agent.
+		:param only_newly_ready: if True, consider only agents who became willing by the last append.
+		 This is enough when no remaining agent was willing before the last append.
+		"""
+		willing = remaining_mask & (self._newly_ready if only_newly_ready else self._ready)
+		# argmax returns 0 when no entry is True, so a single reduction both finds and gates the willing agent:
+		first = int(np.argmax(willing))
+		return first if willing[first] else None
 
 
 	def fill(self, remaining_objects, remaining_agents)->(int, list):
 		"""
 		Fill the bag with objects until at least one agent is willing to accept it.
+		:param remaining_objects: an iterable of the objects that may be appended to the bag, in order.
+		:param remaining_agents: a list of the agents who may accept the bag, or a boolean mask marking these agents.
 		:return the willing agent, or None if the objects are insufficient.
 		>>> bag = Bag(values=[[1,2,3,4,5,6],[6,5,4,3,2,1]], thresholds=[10,10])
 		>>> remaining_objects = list(range(6))
@@ -117,18 +191,35 @@ class Bag:
 		>>> bag.fill(remaining_objects=[1], remaining_agents=[0])
 		(0, [0])
 		"""
-		if len(remaining_agents)==0:
+		remaining_mask = self._agents_mask(remaining_agents)
+		if not remaining_mask.any():
 			return (None, None)
-		willing_agent = self.willing_agent(remaining_agents)
+		willing_agent = self._willing_agent_in_mask(remaining_mask)
 		if willing_agent is not None:
 			return (willing_agent, self.objects)
+		if _fill_bag_compiled is not None:
+			return self._fill_compiled(remaining_objects, remaining_mask)
 		for object in remaining_objects:
 			self.append(object)
-			willing_agent = self.willing_agent(remaining_agents)
+			willing_agent = self._willing_agent_in_mask(remaining_mask, only_newly_ready=True)
 			if willing_agent is not None:
 				return (willing_agent, self.objects)
 		return (None, None)
 
+	def _fill_compiled(self, remaining_objects, remaining_mask:np.ndarray)->(int, list):
+		"""
+		Same as the loop in `fill`, but runs the numba-compiled kernel.
+		"""
+		objects = np.asarray(list(remaining_objects), dtype=np.intp)
+		(willing_agent, last_index) = _fill_bag_compiled(self._value_matrix, self._thresholds, self.map_agent_to_bag_value, remaining_mask, objects)
+		appended_objects = objects if willing_agent < 0 else objects[:last_index+1]
+		self.objects.extend(appended_objects.tolist())
+		self._update_ready()
+		logger.info("   Appended objects %s.", appended_objects)
+		if willing_agent < 0:
+			return (None, None)
+		return (int(willing_agent), self.objects)
+
 	def __str__(self):
 		return f"Bag objects: {self.objects}, values: {self.map_agent_to_bag_value}"
 
@@ -145,16 +236,27 @@ class SequentialAllocation:
 	"""
 
 	def __init__(self, agents:list, objects:list, logger):
-		self.remaining_agents = list(agents)
-		self.remaining_objects = list(objects)
+		agents = list(agents)
+		objects = list(objects)
 		self.bundles = len(agents)*[None]
+		self.remaining_agents_mask = np.zeros(len(agents), dtype=bool)
+		self.remaining_agents_mask[agents] = True
+		self.remaining_objects_mask = np.zeros(max(objects, default=-1)+1, dtype=bool)
+		self.remaining_objects_mask[objects] = True
 		self.logger = logger
 
+	@property
+	def remaining_agents(self)->np.ndarray:
+		return np.flatnonzero(self.remaining_agents_mask)
+
+	@property
+	def remaining_objects(self)->np.ndarray:
+		return np.flatnonzero(self.remaining_objects_mask)
+
 	def let_agent_get_objects(self, i_agent, allocated_objects):
 		self.bundles[i_agent] = allocated_objects
-		self.remaining_agents.remove(i_agent)
-		for o in allocated_objects: 
-			self.remaining_objects.remove(o)
+		self.remaining_agents_mask[i_agent] = False
+		self.remaining_objects_mask[allocated_objects] = False
 		self.logger.info("Agent %d takes the bag with objects %s. Remaining agents: %s. Remaining objects: %s.", 
 			i_agent, allocated_objects, self.remaining_agents, self.remaining_objects)
 
@@ -163,12 +265,14 @@ class SequentialAllocation:
 #####################
 
 
-def one_directional_bag_filling(values, thresholds:List[float]):
+def one_directional_bag_filling(values, thresholds:List[float], order_by_max_value:bool=False):
 	"""
 	The simplest bag-filling procedure: fills a bag in the given order of objects.
 	
 	:param valuations: a valuation matrix (a row for each agent, a column for each object).
 	:param thresholds: determines, for each agent, the minimum value that should be in a bag before the agent accepts it.
+	:param order_by_max_value: if True, the bag is filled in descending order of the objects' maximum value to any agent,
+	  which usually makes bags reach the thresholds with fewer objects.
 
 	>>> one_directional_bag_filling(values=[[11,33],[44,22]], thresholds=[30,30])
 	Agent #0 gets {1} with value 33.
@@ -182,6 +286,14 @@ def one_directional_bag_filling(values, thresholds:List[float]):
 	Agent #0 gets {} with value 0.
 	Agent #1 gets {0} with value 44.
 	<BLANKLINE>
+	>>> one_directional_bag_filling(values=[[1,2,10],[1,2,10]], thresholds=[3,3])
+	Agent #0 gets {0,1} with value 3.
+	Agent #1 gets {2} with value 10.
+	<BLANKLINE>
+	>>> one_directional_bag_filling(values=[[1,2,10],[1,2,10]], thresholds=[3,3], order_by_max_value=True)
+	Agent #0 gets {2} with value 10.
+	Agent #1 gets {0,1} with value 3.
+	<BLANKLINE>
 	"""
 	values = valuations.matrix_from(values)
 	if len(thresholds) != values.num_of_agents:
@@ -189,8 +301,13 @@ def one_directional_bag_filling(values, thresholds:List[float]):
 
 	allocation = SequentialAllocation(values.agents(), values.objects(), logger)
 	bag = Bag(values, thresholds)
+	if order_by_max_value:
+		object_order = np.argsort(-bag._value_matrix.max(axis=0, initial=-np.inf), kind="stable")
+	else:
+		object_order = np.arange(values.num_of_objects)
 	while True:
-		(willing_agent, allocated_objects) = bag.fill(allocation.remaining_objects, allocation.remaining_agents)
+		remaining_objects = object_order[allocation.remaining_objects_mask[object_order]]
+		(willing_agent, allocated_objects) = bag.fill(remaining_objects, allocation.remaining_agents_mask)
 		if willing_agent is None:  break
 		allocation.let_agent_get_objects(willing_agent, allocated_objects)
 		bag.reset()
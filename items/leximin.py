@@ -16,10 +16,10 @@ See also: [max_welfare.py](max_welfare.py).
 Since:  2021-05
 """
 
-import numpy as np, cvxpy
+import numpy as np, cvxpy, scipy.optimize, scipy.sparse
 from fairpy import valuations, Allocation, AllocationToFamilies, map_agent_to_family
-from fairpy.solve import maximize
-from typing import List
+from fairpy.solve import solve
+from typing import List, Callable
 
 import logging
 logger = logging.getLogger(__name__)
@@ -38,69 +38,249 @@ def is_leximin_better(x:list, y:list):
 
 
 TOLERANCE_FACTOR=1.001  # for comparing floating-point numbers
+DUAL_TOLERANCE=1e-3     # a dual value above this is considered positive
 
 
 #### Generic leximin solver:
 
-def leximin_optimal_solution(variables, utilities, constraints) -> np.ndarray:
+def _saturate_agents(num_of_agents:int, solve_max_min:Callable, solve_max_sum:Callable) -> int:
     """
-    Find a leximin-optimal vector of utilities, subject to the given constraints.
-    :param variables: an array of cvxpy variables, over which the optimization is done.
-    :param utilities: a list of cvxpy expressions using these variables, representing the agents' utilities.
-    :param constraints: a list of cvxpy constraints.
-    :return an ndarray with the optimal values of the given variables.
-
-    For usage examples and doctests, see the functions below: leximin_optimal_allocation, leximin_optimal_allocation_for_families.
+    The main loop of Willson's algorithm: repeatedly maximize the minimum utility of the free agents,
+    and find which free agents are saturated at this utility, until all agents are saturated.
+    The linear programs are solved by the given functions, so the loop does not depend on the solver:
+
+    :param solve_max_min: a function (is_free, saturated_utility) -> (max_min_utility, utilities, order_duals).
+       It should maximize t subject to utilities[i] >= is_free[i]*t + saturated_utility[i] for every agent i.
+       order_duals are the dual values of these order constraints, or None if they are not available.
+    :param solve_max_sum: a function (objective_weights, is_constrained, lower_bound) -> (max_value, utilities).
+       It should maximize objective_weights @ utilities subject to is_constrained[i]*utilities[i] >= lower_bound[i] for every agent i.
+    :return the number of calls to the solver. The solution found in the last call is leximin-optimal.
     """
-    leximin_optimal_solution.num_of_calls_to_solver = 0  # for performance analysis
-    num_of_agents = len(utilities)
+    if num_of_agents == 2:
+        return _saturate_two_agents(solve_max_min, solve_max_sum)
+    num_of_calls_to_solver = 0
 
-    # Initially all agents are free - no agent is saturated:
+    # Initially all agents are free - no agent is saturated.
+    # For a free agent, is_free=1 and saturated_utility=0; for a saturated agent, is_free=0 and saturated_utility is its saturated utility.
+    # Both arrays are updated in place when an agent becomes saturated, and passed as-is to the solver functions.
     free_agents = list(range(num_of_agents))
-    map_saturated_agent_to_saturated_utility = num_of_agents * [None]
-    order_constraints_for_saturated_agents = []
+    is_free = np.ones(num_of_agents)
+    saturated_utility = np.zeros(num_of_agents)
+
+    def saturate(iagent:int, utility:float):
+        is_free[iagent] = 0
+        saturated_utility[iagent] = utility
 
     while True:
-        logger.info("Saturated utilities: %s.", map_saturated_agent_to_saturated_utility)
-        min_utility_for_free_agents = cvxpy.Variable()
-        order_constraints_for_free_agents = [
-            utilities[i] >= min_utility_for_free_agents
-            for i in free_agents
-        ]
-        max_min_utility_for_free_agents = maximize(min_utility_for_free_agents, constraints + order_constraints_for_saturated_agents + order_constraints_for_free_agents)
-        leximin_optimal_solution.num_of_calls_to_solver += 1
-        utilities_in_max_min_allocation = [utility.value for utility in utilities]
+        logger.info("Saturated utilities: %s.", [None if is_free[i] else saturated_utility[i] for i in range(num_of_agents)])
+        (max_min_utility_for_free_agents, utilities_in_max_min_allocation, order_duals) = solve_max_min(is_free, saturated_utility)
+        num_of_calls_to_solver += 1
         logger.info("  max min value: %g, utility-profile: %s", max_min_utility_for_free_agents, utilities_in_max_min_allocation)
 
+        # Each saturated agent must keep its saturated utility; each free agent must get at least the max-min utility:
+        lower_bounds = saturated_utility + is_free * max_min_utility_for_free_agents
+
+        # A free agent whose order constraint has a positive dual value is saturated: 
+        #   the dual values of the free agents sum to 1, and for every feasible solution, the dual-weighted sum of their utilities is at most the max-min utility.
+        for ifree in free_agents:
+            if order_duals is not None and order_duals[ifree] > DUAL_TOLERANCE:
+                logger.info("  Dual value of agent #%d is %g, so agent becomes saturated.", ifree, order_duals[ifree])
+                saturate(ifree, max_min_utility_for_free_agents)
+
+        # Other free agents whose utility cannot be improved in the max-min allocation are candidates for saturation.
+        # Maximize the sum of their utilities in a single LP: the candidates who get more than the max-min utility remain free.
+        # A candidate who does not get more is not necessarily saturated (the sum may be maximized at its expense), so it is checked separately below.
+        candidates = [i for i in free_agents 
+            if is_free[i]
+            and utilities_in_max_min_allocation[i] <= TOLERANCE_FACTOR*max_min_utility_for_free_agents]
+        utilities_in_max_sum_allocation = utilities_in_max_min_allocation
+        if len(candidates) > 1:
+            objective_weights = np.zeros(num_of_agents)
+            objective_weights[candidates] = 1
+            (_, utilities_in_max_sum_allocation) = solve_max_sum(objective_weights, np.ones(num_of_agents), lower_bounds)
+            num_of_calls_to_solver += 1
+            logger.info("  utility-profile maximizing the sum of candidates %s: %s", candidates, utilities_in_max_sum_allocation)
+
         for ifree in free_agents:  # Find whether i's utility can be improved
+            if not is_free[ifree]:
+                continue
             if utilities_in_max_min_allocation[ifree] > TOLERANCE_FACTOR*max_min_utility_for_free_agents:
                 logger.info("  Max utility of agent #%d is at least %g, so agent remains free.", ifree, utilities_in_max_min_allocation[ifree])
                 continue
-            new_order_constraints_for_free_agents = [
-                utilities[i] >= max_min_utility_for_free_agents
-                for i in free_agents if i!=ifree
-            ]
-            max_utility_for_ifree = maximize(utilities[ifree], constraints + order_constraints_for_saturated_agents + new_order_constraints_for_free_agents)
-            leximin_optimal_solution.num_of_calls_to_solver += 1
+            if utilities_in_max_sum_allocation[ifree] > TOLERANCE_FACTOR*max_min_utility_for_free_agents:
+                logger.info("  Max utility of agent #%d is at least %g, so agent remains free.", ifree, utilities_in_max_sum_allocation[ifree])
+                continue
+            # Maximize the utility of ifree, subject to all other agents getting at least their lower bound:
+            indicator = np.zeros(num_of_agents)
+            indicator[ifree] = 1
+            (max_utility_for_ifree, _) = solve_max_sum(indicator, 1 - indicator, (1 - indicator) * lower_bounds)
+            num_of_calls_to_solver += 1
             if max_utility_for_ifree > TOLERANCE_FACTOR*max_min_utility_for_free_agents:
                 logger.info("  Max utility of agent #%d is %g, so agent remains free.", ifree, max_utility_for_ifree)
                 continue
             logger.info("  Max utility of agent #%d is %g, so agent becomes saturated.", ifree, max_utility_for_ifree)
-            map_saturated_agent_to_saturated_utility[ifree] = max_min_utility_for_free_agents
-            order_constraints_for_saturated_agents.append(utilities[ifree] >= max_min_utility_for_free_agents)
+            saturate(ifree, max_min_utility_for_free_agents)
 
-        new_free_agents = [i for i in free_agents if map_saturated_agent_to_saturated_utility[i] is None]
+        new_free_agents = [i for i in free_agents if is_free[i]]
         if len(new_free_agents)==len(free_agents):
             raise ValueError("No new saturated agents - this contradicts Willson's theorem!")
         elif len(new_free_agents)==0:
-            logger.info("All agents are saturated -- utility profile is %s.", map_saturated_agent_to_saturated_utility)
-            logger.info("%d calls to solver.", leximin_optimal_solution.num_of_calls_to_solver)
-            return variables.value
+            logger.info("All agents are saturated -- utility profile is %s.", saturated_utility)
+            logger.info("%d calls to solver.", num_of_calls_to_solver)
+            return num_of_calls_to_solver
         else:
             free_agents = new_free_agents
             continue
 
 
+def _saturate_two_agents(solve_max_min:Callable, solve_max_sum:Callable) -> int:
+    """
+    A specialization of _saturate_agents for two agents, which needs at most three calls to the solver (usually two):
+    maximize the minimum utility t, and then maximize the utility of the agent who is not saturated at t.
+    At least one agent is saturated at t: if each agent could get more than t while the other gets at least t,
+    then by convexity, both agents could get more than t simultaneously.
+    :return the number of calls to the solver. The solution found in the last call is leximin-optimal.
+    """
+    (max_min_utility, utilities_in_max_min_allocation, order_duals) = solve_max_min(np.ones(2), np.zeros(2))
+    logger.info("  max min value: %g, utility-profile: %s", max_min_utility, utilities_in_max_min_allocation)
+    num_of_calls_to_solver = 1
+
+    # Find the agents that may be unsaturated, starting with the most likely one:
+    if order_duals is not None and max(order_duals) > DUAL_TOLERANCE:
+        agents_to_improve = [int(np.argmin(order_duals))]   # the other agent has a positive dual, so it is saturated.
+    elif utilities_in_max_min_allocation[0] > TOLERANCE_FACTOR*max_min_utility:
+        agents_to_improve = [0]   # agent 1 cannot get more than t while agent 0 gets more, so agent 1 is saturated.
+    elif utilities_in_max_min_allocation[1] > TOLERANCE_FACTOR*max_min_utility:
+        agents_to_improve = [1]
+    else:
+        agents_to_improve = [0, 1]
+
+    for iagent in agents_to_improve:
+        # Maximize the utility of iagent, subject to the other agent getting at least the max-min utility:
+        indicator = np.zeros(2)
+        indicator[iagent] = 1
+        (max_utility, _) = solve_max_sum(indicator, 1 - indicator, (1 - indicator) * max_min_utility)
+        num_of_calls_to_solver += 1
+        if max_utility > TOLERANCE_FACTOR*max_min_utility:
+            logger.info("  Max utility of agent #%d is %g, so the other agent is saturated.", iagent, max_utility)
+            break
+        logger.info("  Max utility of agent #%d is %g, so agent is saturated.", iagent, max_utility)
+    logger.info("%d calls to solver.", num_of_calls_to_solver)
+    return num_of_calls_to_solver
+
+
+def leximin_optimal_solution(variables, utilities, constraints) -> np.ndarray:
+    """
+    Find a leximin-optimal vector of utilities, subject to the given constraints.
+    :param variables: an array of cvxpy variables, over which the optimization is done.
+    :param utilities: a list of cvxpy expressions using these variables, representing the agents' utilities.
+    :param constraints: a list of cvxpy constraints.
+    :return an ndarray with the optimal values of the given variables.
+
+    >>> alloc = cvxpy.Variable(2)  # the fractions of a single object given to agents 0 and 1.
+    >>> solution = leximin_optimal_solution(alloc, [3*alloc[0], alloc[1]], [cvxpy.sum(alloc)==1, alloc>=0])
+    >>> np.round(solution, 2)
+    array([0.25, 0.75])
+
+    When the utilities are linear and the constraints are linear equations, leximin_optimal_linear_solution is faster.
+    """
+    num_of_agents = len(utilities)
+    utilities_vector = cvxpy.hstack(utilities)
+
+    # The two problems below are constructed once, and re-solved with different parameter values,
+    # so that cvxpy does not have to re-canonicalize them in each iteration.
+
+    # Problem 1: maximize the minimum utility of the free agents, subject to the saturated agents getting their saturated utility.
+    min_utility_for_free_agents = cvxpy.Variable()
+    is_free = cvxpy.Parameter(num_of_agents, value=np.ones(num_of_agents))
+    saturated_utility = cvxpy.Parameter(num_of_agents, value=np.zeros(num_of_agents))
+    order_constraints = utilities_vector >= cvxpy.multiply(is_free, min_utility_for_free_agents) + saturated_utility
+    max_min_problem = cvxpy.Problem(cvxpy.Maximize(min_utility_for_free_agents), constraints + [order_constraints])
+
+    # Problem 2: maximize a weighted sum of utilities, subject to the constrained agents getting at least their lower bound.
+    objective_weights = cvxpy.Parameter(num_of_agents, value=np.zeros(num_of_agents))
+    is_constrained = cvxpy.Parameter(num_of_agents, value=np.ones(num_of_agents))
+    lower_bound = cvxpy.Parameter(num_of_agents, value=np.zeros(num_of_agents))
+    max_sum_problem = cvxpy.Problem(
+        cvxpy.Maximize(objective_weights @ utilities_vector),
+        constraints + [cvxpy.multiply(is_constrained, utilities_vector) >= lower_bound])
+
+    def solve_max_min(is_free_value, saturated_utility_value):
+        is_free.value = is_free_value
+        saturated_utility.value = saturated_utility_value
+        solve(max_min_problem, warm_start=True)
+        return (min_utility_for_free_agents.value.item(), [utility.value for utility in utilities], order_constraints.dual_value)
+
+    def solve_max_sum(objective_weights_value, is_constrained_value, lower_bound_value):
+        objective_weights.value = objective_weights_value
+        is_constrained.value = is_constrained_value
+        lower_bound.value = lower_bound_value
+        solve(max_sum_problem, warm_start=True)
+        return (max_sum_problem.value, [utility.value for utility in utilities])
+
+    leximin_optimal_solution.num_of_calls_to_solver = _saturate_agents(num_of_agents, solve_max_min, solve_max_sum)  # for performance analysis
+    return variables.value
+
+
+def _linprog(c, A_ub, b_ub, A_eq, b_eq, bounds):
+    """
+    Solve the LP:  minimize c@x subject to A_ub@x <= b_ub, A_eq@x == b_eq, and the given bounds, using the HiGHS solver.
+    """
+    result = scipy.optimize.linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds, method="highs")
+    if result.status == 2:
+        raise ValueError("Problem is infeasible")
+    elif result.status == 3:
+        raise ValueError("Problem is unbounded")
+    elif result.status != 0:
+        raise ValueError(f"linprog failed: {result.message}")
+    return result
+
+
+def leximin_optimal_linear_solution(utility_matrix, A_eq, b_eq) -> np.ndarray:
+    """
+    Find a leximin-optimal vector of utilities, where the utilities are linear in some non-negative variables, 
+    and the variables are subject to linear equations.
+    The linear programs are solved directly by scipy's linprog with the HiGHS solver, without the overhead of cvxpy.
+    :param utility_matrix: a matrix U (ndarray or scipy.sparse) with a row for each agent and a column for each variable. The utilities are U@x.
+    :param A_eq, b_eq: the constraints on the variables are A_eq@x == b_eq and x >= 0.
+    :return an ndarray with the optimal values of the variables.
+
+    >>> leximin_optimal_linear_solution([[5,0],[0,3]], A_eq=[[1,1]], b_eq=[1])   # two agents share a single object.
+    array([0.375, 0.625])
+    """
+    utility_matrix = scipy.sparse.csr_matrix(utility_matrix, dtype=float)
+    A_eq = scipy.sparse.csr_matrix(A_eq, dtype=float)
+    b_eq = np.asarray(b_eq, dtype=float)
+    (num_of_agents, num_of_variables) = utility_matrix.shape
+    minus_utility_matrix = -utility_matrix
+
+    # In the max-min LP, the last variable is the minimum utility t of the free agents; it is not bounded.
+    max_min_objective = np.zeros(num_of_variables+1)
+    max_min_objective[-1] = -1    # maximize t
+    max_min_A_eq = scipy.sparse.hstack([A_eq, scipy.sparse.csr_matrix((A_eq.shape[0], 1))], format="csr")
+    max_min_bounds = [(0, None)]*num_of_variables + [(None, None)]
+    solution = None
+
+    def solve_max_min(is_free, saturated_utility):
+        nonlocal solution
+        # utilities >= is_free*t + saturated_utility  <==>  -utilities + is_free*t <= -saturated_utility
+        max_min_A_ub = scipy.sparse.hstack([minus_utility_matrix, scipy.sparse.csr_matrix(is_free.reshape(-1,1))], format="csr")
+        result = _linprog(max_min_objective, max_min_A_ub, -saturated_utility, max_min_A_eq, b_eq, max_min_bounds)
+        solution = result.x[:-1]
+        return (-result.fun, utility_matrix @ solution, -result.ineqlin.marginals)
+
+    def solve_max_sum(objective_weights, is_constrained, lower_bound):
+        nonlocal solution
+        # is_constrained*utilities >= lower_bound  <==>  -is_constrained*utilities <= -lower_bound
+        max_sum_A_ub = scipy.sparse.diags(is_constrained) @ minus_utility_matrix
+        result = _linprog(-(utility_matrix.T @ objective_weights), max_sum_A_ub, -lower_bound, A_eq, b_eq, (0, None))
+        solution = result.x
+        return (-result.fun, utility_matrix @ solution)
+
+    leximin_optimal_linear_solution.num_of_calls_to_solver = _saturate_agents(num_of_agents, solve_max_min, solve_max_sum)  # for performance analysis
+    return solution
+
+
 
 
 ##### Find a leximin-optimal allocation for individual agents
@@ -142,22 +322,35 @@ def leximin_optimal_allocation(agents) -> Allocation:
     >>> logger.setLevel(logging.WARNING)
     """
     v = valuations.matrix_from(agents)
-
-    alloc = cvxpy.Variable((v.num_of_agents, v.num_of_objects))
-    feasibility_constraints = [
-        sum([alloc[i][o] for i in v.agents()])==1
-        for o in v.objects()
-    ]
-    positivity_constraints = [
-        alloc[i][o] >= 0 for i in v.agents()
-        for o in v.objects()
-    ]
-    utilities = [sum([alloc[i][o]*v[i][o] for o in v.objects()]) for i in v.agents()]
-
-    allocation_matrix = leximin_optimal_solution(alloc, utilities, feasibility_constraints+positivity_constraints)
+    allocation_matrix = _leximin_optimal_allocation_matrix(v, agent_to_bundle=range(v.num_of_agents), num_of_bundles=v.num_of_agents)
     return Allocation(v, allocation_matrix)
 
 
+def _leximin_optimal_allocation_matrix(v:valuations.ValuationMatrix, agent_to_bundle:List[int], num_of_bundles:int) -> np.ndarray:
+    """
+    Find a fractional allocation of the objects into bundles, that maximizes the leximin vector of the agents' utilities,
+    where each agent gets the utility of a single bundle.
+    :param agent_to_bundle: maps each agent to the index of its bundle.
+    :return the allocation matrix: a row for each bundle, a column for each object.
+    """
+    num_of_objects = v.num_of_objects
+    num_of_variables = num_of_bundles*num_of_objects
+    values = np.asarray(v._v, dtype=float)
+
+    # The variables are the allocation matrix flattened row by row: variable b*num_of_objects+o is the fraction of object o in bundle b.
+    # Row i of the utility matrix contains the values of agent i, in the columns of the bundle of agent i.
+    columns = np.asarray(agent_to_bundle).reshape(-1,1)*num_of_objects + np.arange(num_of_objects)
+    utility_matrix = scipy.sparse.csr_matrix(
+        (values.ravel(), columns.ravel(), np.arange(0, values.size+1, num_of_objects)),
+        shape=(v.num_of_agents, num_of_variables))
+    # Each object is allocated entirely:
+    A_eq = scipy.sparse.hstack(num_of_bundles*[scipy.sparse.identity(num_of_objects)], format="csr")
+    b_eq = np.ones(num_of_objects)
+
+    solution = leximin_optimal_linear_solution(utility_matrix, A_eq, b_eq)
+    return solution.reshape(num_of_bundles, num_of_objects)
+
+
 ##### leximin for families
 
 
@@ -195,17 +388,7 @@ def leximin_optimal_allocation_for_families(agents, families:list) -> Allocation
     agent_to_family = map_agent_to_family(families, v.num_of_agents)
     logger.info("map_agent_to_family = %s",agent_to_family)
 
-    alloc = cvxpy.Variable((num_of_families, v.num_of_objects))
-    feasibility_constraints = [
-        sum([alloc[f][o] for f in range(num_of_families)])==1
-        for o in v.objects()
-    ]
-    positivity_constraints = [
-        alloc[f][o] >= 0 for f in range(num_of_families)
-        for o in v.objects()
-    ]
-    utilities = [sum([alloc[agent_to_family[i]][o]*v[i][o] for o in v.objects()]) for i in v.agents()]
-    allocation_matrix = leximin_optimal_solution(alloc, utilities, feasibility_constraints+positivity_constraints)
+    allocation_matrix = _leximin_optimal_allocation_matrix(v, agent_to_bundle=agent_to_family, num_of_bundles=num_of_families)
     return AllocationToFamilies(v, allocation_matrix, families)
 
 
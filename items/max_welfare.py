@@ -32,15 +32,9 @@ def max_welfare_allocation(agents, welfare_function, welfare_constraint_function
     """
     v = valuations.matrix_from(agents)
     alloc = cvxpy.Variable((v.num_of_agents, v.num_of_objects))
-    feasibility_constraints = [
-        sum([alloc[i][o] for i in v.agents()])==1
-        for o in v.objects()
-    ]
-    positivity_constraints = [
-        alloc[i][o] >= 0 for i in v.agents()
-        for o in v.objects()
-    ]
-    utilities = [sum([alloc[i][o]*v[i][o] for o in v.objects()]) for i in v.agents()]
+    feasibility_constraints = [cvxpy.sum(alloc, axis=0)==1]   # each object is allocated entirely
+    positivity_constraints = [alloc >= 0]
+    utilities = [alloc[i] @ v[i] for i in v.agents()]
     if welfare_constraint_function is not None:
         welfare_constraints = [welfare_constraint_function(utility) for utility in utilities]
     else:
@@ -70,15 +64,9 @@ def max_welfare_allocation_for_families(agents, families:list, welfare_function,
     agent_to_family = map_agent_to_family(families, v.num_of_agents)
 
     alloc = cvxpy.Variable((num_of_families, v.num_of_objects))
-    feasibility_constraints = [
-        sum([alloc[f][o] for f in range(num_of_families)])==1
-        for o in v.objects()
-    ]
-    positivity_constraints = [
-        alloc[f][o] >= 0 for f in range(num_of_families)
-        for o in v.objects()
-    ]
-    utilities = [sum([alloc[agent_to_family[i]][o]*v[i][o] for o in v.objects()]) for i in v.agents()]
+    feasibility_constraints = [cvxpy.sum(alloc, axis=0)==1]   # each object is allocated entirely
+    positivity_constraints = [alloc >= 0]
+    utilities = [alloc[agent_to_family[i]] @ v[i] for i in v.agents()]
 
     if welfare_constraint_function is not None:
         welfare_constraints = [welfare_constraint_function(utility) for utility in utilities]
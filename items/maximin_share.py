@@ -8,6 +8,7 @@ Since : 2021-04
 
 import cvxpy
 from fairpy.items import partitions 
+from fairpy.items.valuations import AdditiveValuation
 from fairpy.solve import *
 import numbers
 
@@ -82,6 +83,28 @@ def value_1_of_c_MMS__bruteforce(c:int, valuation:list, items:set=None)->int:
 	return best_partition_value
 
 
+def value_1_of_c_MMS__combinatorial(c:int, valuation:list, items:set=None)->int:
+	"""
+	Computes the 1-of-c MMS by the exact combinatorial search of AdditiveValuation:
+	a dynamic program over bitmasks of items for up to MMS_DP_MAX_ITEMS items, and a pruned search for more items.
+	The values of the items should be non-negative.
+	:return the MMS value, or -1 if there are fewer than c items (like value_1_of_c_MMS__bruteforce).
+
+	>>> value_1_of_c_MMS__combinatorial(c=2, valuation=[10,20,40,0])
+	30
+	>>> value_1_of_c_MMS__combinatorial(c=2, valuation=[10,20,40,0], items=[1,2])
+	20
+	>>> value_1_of_c_MMS__combinatorial(c=3, valuation=[10,20])
+	-1
+	"""
+	if items is None:
+		items = range(len(valuation))
+	partition = AdditiveValuation(list(valuation)).partition_1_of_c_MMS(c, list(items))
+	if len(partition) == 0:
+		return -1
+	return min([value_of_bundle(valuation,bundle) for bundle in partition])
+
+
 
 def value_1_of_c_MMS(c:int, valuation:list, **kwargs)->int:
 	"""	
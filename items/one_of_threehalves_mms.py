@@ -41,15 +41,16 @@ def bidirectional_bag_filling(valuation_matrix, thresholds:List[float]) -> Alloc
 	allocation = SequentialAllocation(valuation_matrix.agents(), valuation_matrix.objects(), logger)
 	bag = Bag(valuation_matrix, thresholds)
 	while True:
-		if len(allocation.remaining_objects)==0:  break
+		remaining_objects = allocation.remaining_objects
+		if len(remaining_objects)==0:  break
 
 		# Initialize a bag with the highest-valued object:
-		highest_valued_object = allocation.remaining_objects[0]
+		highest_valued_object = remaining_objects[0]
 		bag.append(highest_valued_object)
 
 		# Fill the bag with the lowest-valued objects:
-		lowest_valued_objects = reversed(allocation.remaining_objects[1:])
-		(willing_agent, allocated_objects) = bag.fill(lowest_valued_objects, allocation.remaining_agents)
+		lowest_valued_objects = reversed(remaining_objects[1:])
+		(willing_agent, allocated_objects) = bag.fill(lowest_valued_objects, allocation.remaining_agents_mask)
 		if willing_agent is None: break
 		allocation.let_agent_get_objects(willing_agent, allocated_objects)
 		bag.reset()
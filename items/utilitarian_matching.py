@@ -14,7 +14,8 @@ Author: Erel Segal-Halevi
 Since : 2021-04
 """
 
-import networkx
+import networkx, numpy as np, scipy.sparse
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
 from typing import *
 from dicttools import stringify
 from collections import defaultdict
@@ -27,6 +28,15 @@ logger = logging.getLogger(__name__)
 AgentsDict = Dict[str, Dict[str, int]]
 
 
+# Utility function to get the capacity from a capacity map if it exists:
+def _get_capacity(map_item_to_capacity:Dict[str,int], item:str):
+    if map_item_to_capacity is None:
+        return 1
+    elif item not in map_item_to_capacity:
+        return 0
+    else:
+        return map_item_to_capacity[item]
+
 
 def instance_to_graph(agents: AgentsDict,  agent_weights: Dict[str, int]=None, item_capacities: Dict[str,int]=None, agent_capacities: Dict[str,int]=None)->networkx.Graph:
     """
@@ -57,42 +67,104 @@ def instance_to_graph(agents: AgentsDict,  agent_weights: Dict[str, int]=None, i
     [('Agent #0', 0, {'weight': 5}), ('Agent #0', 1, {'weight': 4}), (0, 'Agent #1', {'weight': 2}), (1, 'Agent #1', {'weight': 3})]
     """
 
-    # Utility function to get the capacity from a capacity map if it exists:
-    def _get_capacity(map_item_to_capacity:Dict[str,int], item:str):
-        if map_item_to_capacity is None:
-            return 1
-        elif item not in map_item_to_capacity:
-            return 0
-        else:
-            return map_item_to_capacity[item]
-
     agents_list = fairpy.agents_from(agents)
-    graph = networkx.Graph()
+    edges = []
+    map_item_to_nodes = {}   # the nodes of each item are computed once, and shared by all agents.
     for agent in agents_list:
         agent_name = agent.name()
+        agent_weight = 1 if agent_weights is None else agent_weights.get(agent_name,1)
         num_of_agent_clones = _get_capacity(agent_capacities, agent_name)
+        agent_nodes = [agent_name] if num_of_agent_clones==1 else [(agent_name,clone) for clone in range(num_of_agent_clones)]
         for item in agent.all_items():
-            weight = agent.value(item)
-            if agent_weights is not None:
-                weight *= agent_weights.get(agent_name,1)
-            num_of_item_units = _get_capacity(item_capacities, item)
-
-            if num_of_item_units==1 and num_of_agent_clones==1:
-                graph.add_edge(agent_name, item, weight=weight)
-            elif num_of_item_units!=1 and num_of_agent_clones==1:
-                for unit in range(num_of_item_units):
-                    graph.add_edge(agent_name, (item,unit), weight=weight)
-            elif num_of_item_units==1 and num_of_agent_clones!=1:
-                for clone in range(num_of_agent_clones):
-                    graph.add_edge((agent_name,clone), item, weight=weight)
-            else:
-                for clone in range(num_of_agent_clones):
-                    for unit in range(num_of_item_units):
-                        graph.add_edge((agent_name,clone), (item,unit), weight=weight)
+            weight = agent.value(item) * agent_weight
+            item_nodes = map_item_to_nodes.get(item)
+            if item_nodes is None:
+                num_of_item_units = _get_capacity(item_capacities, item)
+                item_nodes = map_item_to_nodes[item] = [item] if num_of_item_units==1 else [(item,unit) for unit in range(num_of_item_units)]
+            edges.extend([(agent_node, item_node, weight) for agent_node in agent_nodes for item_node in item_nodes])
+    graph = networkx.Graph()
+    graph.add_weighted_edges_from(edges)
     return graph
 
 
 
+def _expand_ranges(first_units, num_of_units)->Tuple[np.ndarray, np.ndarray]:
+    """
+    Expands each entry i to the range first_units[i], ..., first_units[i]+num_of_units[i]-1.
+    :return a tuple (entries, units): the index of the entry of each unit, and the unit itself.
+
+    >>> _expand_ranges([10, 0, 5], [2, 0, 3])
+    (array([0, 0, 2, 2, 2]), array([10, 11,  5,  6,  7]))
+    """
+    first_units = np.asarray(first_units, dtype=int)
+    num_of_units = np.asarray(num_of_units, dtype=int)
+    entries = np.repeat(np.arange(len(num_of_units)), num_of_units)
+    offsets = np.arange(len(entries)) - np.repeat(np.cumsum(num_of_units)-num_of_units, num_of_units)
+    return (entries, first_units[entries] + offsets)
+
+
+
+def instance_to_weight_matrix(agents: AgentsDict,  agent_weights: Dict[str, int]=None, item_capacities: Dict[str,int]=None, agent_capacities: Dict[str,int]=None)->Tuple[scipy.sparse.csr_matrix, list, list]:
+    """
+    Converts agents' preferences to the biadjacency matrix of a bipartite graph (a scipy sparse matrix).
+    Each row is a clone of an agent, and each column is a unit of an item.
+    :param agents: maps each agent to a map from an item's name to its value for the agent.
+    :param agent_weights [optional]: maps each agent to a weight. The values of each agent are multiplied by the agent's weight.
+    :param item_capacities [optional]: maps each item to its number of units. Default is 1.
+    :param agent_capacities [optional]: maps each agent to its number of clones. Default is 1.
+    :return a tuple (weights, row_to_agent, column_to_item): the sparse weight matrix, and the agent/item names of its rows/columns.
+
+    >>> prefs = {"avi": {"x":5, "y": 4}, "beni": {"x":2, "y":3}}
+    >>> (weights, row_to_agent, column_to_item) = instance_to_weight_matrix(prefs, item_capacities={"x":1, "y":2})
+    >>> weights.toarray()
+    array([[5., 4., 4.],
+           [2., 3., 3.]])
+    >>> row_to_agent
+    ['avi', 'beni']
+    >>> column_to_item
+    ['x', 'y', 'y']
+    >>> (weights, row_to_agent, column_to_item) = instance_to_weight_matrix(prefs, agent_weights={"avi":1, "beni":100}, agent_capacities={"avi":2, "beni":1})
+    >>> weights.toarray()
+    array([[  5.,   4.],
+           [  5.,   4.],
+           [200., 300.]])
+    >>> row_to_agent
+    ['avi', 'avi', 'beni']
+    """
+    agents_list = fairpy.agents_from(agents)
+    row_to_agent = []
+    unit_to_item = []          # maps each column to its item; the units of each item are a contiguous range of columns.
+    map_item_to_units = {}     # maps each item to the range of its columns.
+    # One entry per (agent, item) pair; the expansion to clones and units is done below with numpy.
+    edge_agents, edge_items, edge_weights = [], [], []
+    agent_clones = []
+    for agent_index,agent in enumerate(agents_list):
+        agent_name = agent.name()
+        agent_weight = 1 if agent_weights is None else agent_weights.get(agent_name,1)
+        num_of_agent_clones = _get_capacity(agent_capacities, agent_name)
+        agent_clones.append(num_of_agent_clones)
+        row_to_agent.extend([agent_name]*num_of_agent_clones)
+        for item in agent.all_items():
+            if item not in map_item_to_units:
+                num_of_item_units = _get_capacity(item_capacities, item)
+                map_item_to_units[item] = range(len(unit_to_item), len(unit_to_item)+num_of_item_units)
+                unit_to_item.extend([item]*num_of_item_units)
+            edge_agents.append(agent_index)
+            edge_items.append(map_item_to_units[item])
+            edge_weights.append(agent.value(item) * agent_weight)
+
+    # Expand each (agent, item) entry to all units of the item, and then to all clones of the agent:
+    (entry_of_unit, columns) = _expand_ranges(first_units=[units.start for units in edge_items], num_of_units=[len(units) for units in edge_items])
+    unit_agents = np.array(edge_agents, dtype=int)[entry_of_unit]
+    agent_clones = np.array(agent_clones, dtype=int)
+    (entry_of_clone, rows) = _expand_ranges(first_units=(np.cumsum(agent_clones)-agent_clones)[unit_agents], num_of_units=agent_clones[unit_agents])
+    data = np.array(edge_weights, dtype=float)[entry_of_unit]
+
+    weights = scipy.sparse.csr_matrix((data[entry_of_clone], (rows, columns[entry_of_clone])), shape=(len(row_to_agent), len(unit_to_item)))
+    return (weights, row_to_agent, unit_to_item)
+
+
+
 def matching_to_allocation(matching: list, agent_names:list)->Dict[str,str]:
     """
     Converts a one-to-many matching in a bipartite graph (output of networkx) to an allocation (given as a dict)
@@ -125,6 +197,7 @@ def matching_to_allocation(matching: list, agent_names:list)->Dict[str,str]:
         else:
             return id
 
+    agent_names = frozenset(agent_names)   # agent_names may be a list, so membership tests would be linear.
     map_agent_to_bundle = defaultdict(list)
     for edge in matching:
         edge = (_remove_unit_index(edge[0]), _remove_unit_index(edge[1]))
@@ -135,12 +208,49 @@ def matching_to_allocation(matching: list, agent_names:list)->Dict[str,str]:
         else:
             raise ValueError(f"Cannot find an agent in {edge}")
         map_agent_to_bundle[agent].append(good)
-    for agent,bundle in map_agent_to_bundle.items():
+    for bundle in map_agent_to_bundle.values():
         bundle.sort()
     return map_agent_to_bundle
     
 
 
+def maximum_weight_matching(agents: AgentsDict, agent_weights: Dict[str, int]=None, item_capacities: Dict[str,int]=None, agent_capacities: Dict[str,int]=None, maxcardinality=True)->Dict[str,list]:
+    """
+    Finds a maximum-weight matching between agent-clones and item-units, using the sparse LAP solver of scipy.
+    :param maxcardinality: True to require maximum weight subject to maximum cardinality. False to require only maximum weight.
+    :return a dict, mapping an agent to its bundle.
+
+    >>> prefs = {"avi": {"x":5, "y": -2}, "beni": {"x":2, "y":-3}}
+    >>> stringify(maximum_weight_matching(prefs, maxcardinality=True))
+    "{avi:['x'], beni:['y']}"
+    >>> stringify(maximum_weight_matching(prefs, maxcardinality=False))
+    "{avi:['x']}"
+    """
+    (weights, row_to_agent, column_to_item) = instance_to_weight_matrix(agents, agent_weights=agent_weights, item_capacities=item_capacities, agent_capacities=agent_capacities)
+    map_agent_to_bundle = defaultdict(list)
+    (num_of_rows, num_of_columns) = weights.shape
+    if num_of_rows==0:
+        return map_agent_to_bundle
+    # scipy requires a matching that saturates all rows, so each row gets a private dummy column.
+    # All weights are shifted by 1, since scipy ignores edges of weight 0.
+    if maxcardinality:
+        # A bonus larger than the total weight of any matching makes every real edge better than any dummy edge.
+        bonus = 2 * min(num_of_rows, num_of_columns) * np.abs(weights.data).max(initial=0) + 1
+        weights.data += bonus + 1
+    else:
+        weights.data[weights.data<=0] = 0
+        weights.eliminate_zeros()
+        weights.data += 1
+    extended_weights = scipy.sparse.hstack([weights, scipy.sparse.identity(num_of_rows)], format="csr")
+    (matched_rows, matched_columns) = min_weight_full_bipartite_matching(extended_weights, maximize=True)
+    for row,column in zip(matched_rows, matched_columns):
+        if column < num_of_columns:
+            map_agent_to_bundle[row_to_agent[row]].append(column_to_item[column])
+    for agent,bundle in map_agent_to_bundle.items():
+        bundle.sort()
+    return map_agent_to_bundle
+
+
 
 def utilitarian_matching(agents: AgentsDict, agent_weights: Dict[str, int]=None, item_capacities: Dict[str,int]=None, agent_capacities: Dict[str,int]=None, maxcardinality=True):
     """
@@ -175,22 +285,22 @@ def utilitarian_matching(agents: AgentsDict, agent_weights: Dict[str, int]=None,
     >>> stringify(alloc.map_item_to_agents(sortkey=lambda name: -agent_weights[name]))
     "{x:['gadi', 'avi'], y:['beni']}"
     >>> alloc = utilitarian_matching(prefs, item_capacities={"x":2, "y":2}, agent_capacities={"avi":2,"beni":1,"gadi":1})
-    >>> stringify(alloc.map_agent_to_bundle())
-    "{avi:['x', 'y'], beni:['y'], gadi:['x']}"
+    >>> bundles = alloc.map_agent_to_bundle()   # there are several maximum-weight matchings, so only their common properties are checked.
+    >>> sum([prefs[agent][item] for agent,bundle in bundles.items() for item in bundle])
+    15
+    >>> {agent:len(bundle) for agent,bundle in bundles.items()}
+    {'avi': 2, 'beni': 1, 'gadi': 1}
 
     >>> prefs = [[5,4],[3,2]]
     >>> alloc = utilitarian_matching(prefs)
-    >>> stringify(alloc.map_agent_to_bundle())
-    '{Agent #0:[1], Agent #1:[0]}'
-    >>> stringify(alloc.map_item_to_agents())
-    "{0:['Agent #1'], 1:['Agent #0']}"
+    >>> bundles = alloc.get_bundles()   # both matchings have weight 7.
+    >>> sum([prefs[agent][item] for agent,bundle in enumerate(bundles) for item in bundle])
+    7
+    >>> sorted([item for bundle in bundles for item in bundle])
+    [0, 1]
     """
-    graph = instance_to_graph(agents, agent_weights=agent_weights, item_capacities=item_capacities, agent_capacities=agent_capacities)
-    logger.info("Graph edges: %s", list(graph.edges.data()))
-    matching = networkx.max_weight_matching(graph, maxcardinality=maxcardinality)
-    logger.info("Matching: %s", matching)
-    agent_names = fairpy.agent_names_from(agents)
-    map_agent_to_bundle = matching_to_allocation(matching, agent_names=agent_names)
+    map_agent_to_bundle = maximum_weight_matching(agents, agent_weights=agent_weights, item_capacities=item_capacities, agent_capacities=agent_capacities, maxcardinality=maxcardinality)
+    logger.info("Matching: %s", map_agent_to_bundle)
     return Allocation(agents, map_agent_to_bundle)
 
 
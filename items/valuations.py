@@ -13,16 +13,26 @@ from collections.abc import Iterable
 
 from dicttools import stringify
 
-import math, itertools
+import math, itertools, heapq
+import numpy as np
 from fractions import Fraction
 
 from fairpy.items import partitions  # Works in Python 3.8
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; without it, the maximin-share dynamic program uses numpy operations.
+    njit = None
+
 from typing import *
 Item = Any
 Bundle = Set[Item]
 
 
+_MAX_CACHE_SIZE = 4096   # the maximum number of cached computations per valuation.
+_FLOAT_TOLERANCE = 1e-9  # a relative bound on the rounding differences between float sums of the same values.
+
+
 class Valuation(ABC):
     """
     An abstract class that describes a valuation function.
@@ -37,8 +47,23 @@ class Valuation(ABC):
         """
         self.desired_items_list = sorted(desired_items)
         self.desired_items = set(desired_items)
+        # The generic computations of the value except c goods enumerate all subsets of c goods, so their results are cached per bundle.
+        # A plain dict (rather than functools.lru_cache on bound methods) keeps the valuation picklable and deep-copyable.
+        self._computation_cache = {}
         self.total_value_cache = self.value(self.desired_items)
 
+    def _cached(self, key:tuple, compute:Callable[[], float])->float:
+        """
+        :return the cached result for the given key; computes it with `compute` if it is not cached yet.
+        The cache is emptied when it reaches _MAX_CACHE_SIZE entries.
+        """
+        cache = self._computation_cache
+        if key not in cache:
+            if len(cache) >= _MAX_CACHE_SIZE:
+                cache.clear()
+            cache[key] = compute()
+        return cache[key]
+
     @abstractmethod
     def value(self, bundle:Bundle)->float:
         """
@@ -71,7 +96,8 @@ class Valuation(ABC):
         >>> a.best_index(["y","xz"])
         1
         """
-        return max(range(len(allocation)), key=lambda i:self.value(allocation[i]))
+        values = self.values_of_bundles(allocation)
+        return max(range(len(values)), key=values.__getitem__)
 
 
     def value_except_best_c_goods(self, bundle:Bundle, c:int=1)->int:
@@ -93,11 +119,60 @@ class Valuation(ABC):
         0
         """
         if len(bundle) <= c: return 0
-        else: return min([
+        bundle = frozenset(bundle)
+        return self._cached(("best", bundle, c), lambda: self._value_except_best_c_goods_uncached(bundle, c))
+
+    def _value_except_best_c_goods_uncached(self, bundle:frozenset, c:int)->int:
+        if c >= 2 and len(bundle) >= 8 and self._is_monotone():
+            return self._value_except_best_c_goods_branch_and_bound(bundle, c)
+        return min([
             self.value(bundle.difference(sub_bundle))
             for sub_bundle in itertools.combinations(bundle, c)
         ])
 
+    def _value_except_best_c_goods_branch_and_bound(self, bundle:frozenset, c:int)->int:
+        """
+        Calculates the value of the given bundle when the "best" c goods are removed from it, for a monotone valuation.
+        Searches the sets of c goods to remove, starting with the goods whose single removal decreases the value the most.
+        When all goods that may still be removed in a branch are removed, the remaining value is a lower bound for the branch
+        (by monotonicity); if it is not smaller than the best value found so far, the branch is pruned.
+
+        >>> item_values = {"a":1, "b":2, "c":3, "d":4, "e":5, "f":6, "g":7, "h":8}
+        >>> a = MonotoneValuation({bundle: sum([item_values[g] for g in bundle]) for bundle in partitions.powerset("abcdefgh")})
+        >>> a.value_except_best_c_goods(set("abcdefgh"), c=2)
+        21
+        >>> a.value_except_best_c_goods(set("abcdefgh"), c=3)
+        15
+        """
+        def value_if_specified(sub_bundle):
+            try:
+                return self.value(sub_bundle)
+            except ValueError:   # e.g. a MonotoneValuation that does not specify the value of this bundle - no pruning.
+                return None
+
+        def removal_impact(item):   # a smaller value without the item means a larger impact.
+            value_without_item = value_if_specified(bundle.difference([item]))
+            return math.inf if value_without_item is None else value_without_item
+
+        items = sorted(bundle, key=removal_impact)
+        best_value = self.value(bundle.difference(items[:c]))
+
+        def search(start:int, removed:tuple):
+            nonlocal best_value
+            if len(removed) == c:
+                best_value = min(best_value, self.value(bundle.difference(removed)))
+                return
+            remaining = bundle.difference(removed)
+            for i in range(start, len(items) - (c - len(removed)) + 1):
+                # Every set of goods in this branch is contained in removed+items[i:], so its remaining value is at least:
+                lower_bound = value_if_specified(remaining.difference(items[i:]))
+                if lower_bound is not None and lower_bound >= best_value:
+                    break   # the lower bound only grows with i.
+                search(i+1, removed + (items[i],))
+
+        search(0, ())
+        return best_value
+
     def value_except_worst_c_goods(self, bundle:Bundle, c:int=1)->int:
         """
         Calculates the value of the given bundle when the "worst" c goods are removed from it.
@@ -111,7 +186,11 @@ class Valuation(ABC):
         2
         """
         if len(bundle) <= c: return 0
-        else: return max([
+        bundle = frozenset(bundle)
+        return self._cached(("worst", bundle, c), lambda: self._value_except_worst_c_goods_uncached(bundle, c))
+
+    def _value_except_worst_c_goods_uncached(self, bundle:frozenset, c:int)->int:
+        return max([
             self.value(bundle.difference(sub_bundle))
             for sub_bundle in itertools.combinations(bundle, c)
         ])
@@ -131,13 +210,13 @@ class Valuation(ABC):
         >>> items = ['a','b' ,'c', 'd', 'e', 'f']
         >>> item_values = {'a': 5, 'b': 5, 'c': 3, 'd': 4, 'e': 5, 'f': 5}
         >>> valuation = AdditiveValuation(item_values)
-        >>> mms_part = valuation.partition_1_of_c_MMS(3,items)
+        >>> mms_part = Valuation.partition_1_of_c_MMS(valuation, 3,items)   # the generic algorithm (AdditiveValuation overrides it).
         >>> [sorted(x) for x in mms_part]
         [['b', 'c'], ['a', 'd'], ['e', 'f']]
-        >>> mms_part = valuation.partition_1_of_c_MMS(4,items)
+        >>> mms_part = Valuation.partition_1_of_c_MMS(valuation, 4,items)
         >>> [sorted(x) for x in mms_part]
         [['a'], ['b'], ['c', 'd'], ['e', 'f']]
-        >>> mms_part = valuation.partition_1_of_c_MMS(4,['a','b','c'])
+        >>> mms_part = Valuation.partition_1_of_c_MMS(valuation, 4,['a','b','c'])
         >>> [sorted(x) for x in mms_part]
         []
         """
@@ -190,8 +269,63 @@ class Valuation(ABC):
         """
         Calculates the proportional value of that agent, when the c most valuable goods are ignored.
         This is a subroutine in checking whether an allocation is PROPc.
+
+        >>> AdditiveValuation({"x": 1, "y": 2, "z": 4}).value_proportional_except_c(num_of_agents=2, c=1)
+        Fraction(3, 2)
+        """
+        # The proportional share depends only on the number of agents and on c, not on the bundle:
+        return self._cached(("proportional", num_of_agents, c),
+            lambda: Fraction(self.value_except_best_c_goods(self.desired_items, c) , num_of_agents))
+
+    def _is_monotone(self)->bool:
+        """
+        :return True if the valuation is known to be monotone (adding items never decreases the value).
         """
-        return Fraction(self.value_except_best_c_goods(self.desired_items, c) , num_of_agents)
+        return False
+
+    def _can_skip_unenvied_bundles(self)->bool:
+        """
+        :return True if the valuation is monotone (adding items never decreases the value) and defined on every bundle.
+        In this case, removing goods from a bundle never increases its value, so envy-checks can skip bundles
+        that are not more valuable than the own bundle.
+        """
+        return False
+
+    def _canonical_bundle(self, bundle:Bundle)->Bundle:
+        """
+        :return a representation of the given bundle that is fast to evaluate repeatedly by `value` and `value_except_*_c_goods`.
+        Used by the envy-freeness checks, which evaluate each bundle several times.
+        """
+        return bundle
+
+    def values_of_bundles(self, bundles:List[Bundle])->List[float]:
+        """
+        Calculates the agent's values for several bundles.
+        Subclasses may override it to evaluate all bundles in a single vectorized operation.
+
+        >>> MonotoneValuation({"x": 1, "y": 2, "xy": 4}).values_of_bundles([{"x"}, "xy", set()])
+        [1, 4, 0]
+        """
+        return [self.value(bundle) for bundle in bundles]
+
+    def _bundles_possibly_envied(self, own_bundle:Bundle, all_bundles:List[Bundle])->List[Bundle]:
+        """
+        Used for the envy-freeness checks.
+        :return the bundles that may be envied (even after removing some goods), from the most valuable to the least valuable.
+        """
+        if not self._can_skip_unenvied_bundles():
+            return all_bundles
+        # The own bundle is evaluated in the same way as the other bundles, so that equal bundles get equal values:
+        values = self.values_of_bundles([own_bundle] + all_bundles)
+        own_value = values[0]
+        if isinstance(own_value, float):
+            # Removing goods never increases the value, but float sums in a different order may differ in the last bits,
+            # so bundles that are nearly as valuable as the own bundle are kept, and checked exactly by the caller.
+            own_value -= _FLOAT_TOLERANCE * abs(own_value)
+        values_and_bundles = zip(values[1:], all_bundles)
+        envied = [(value, bundle) for (value, bundle) in values_and_bundles if value > own_value]
+        envied.sort(key=lambda pair: -pair[0])
+        return [bundle for (_, bundle) in envied]
 
     def is_EFc(self, own_bundle:Bundle, all_bundles:List[Bundle], c: int) -> bool:
         """
@@ -201,7 +335,8 @@ class Valuation(ABC):
         :return: True iff the current agent finds the allocation EFc.
         """
         own_value = self.value(own_bundle)
-        for other_bundle in all_bundles:
+        all_bundles = [self._canonical_bundle(bundle) for bundle in all_bundles]
+        for other_bundle in self._bundles_possibly_envied(own_bundle, all_bundles):
             if own_value < self.value_except_best_c_goods(other_bundle, c):
                 return False
         return True
@@ -223,7 +358,8 @@ class Valuation(ABC):
         :return: True iff the current agent finds the allocation EFx.
         """
         own_value = self.value(own_bundle)
-        for other_bundle in all_bundles:
+        all_bundles = [self._canonical_bundle(bundle) for bundle in all_bundles]
+        for other_bundle in self._bundles_possibly_envied(own_bundle, all_bundles):
             if own_value < self.value_except_worst_c_goods(other_bundle, c=1):
                 return False
         return True
@@ -254,8 +390,16 @@ class Valuation(ABC):
         :param num_of_agents:  the total number of agents.
         :param c: how many best-goods to exclude from the total bundle.
         :return: True iff the current agent finds the allocation PROPc.
+
+        >>> a = AdditiveValuation({"x": 1, "y": 2, "z": 4})
+        >>> a.is_PROPc({"x"}, 3, c=1), a.is_PROPc({"x"}, 2, c=1)
+        (True, False)
+        >>> a = AdditiveValuation({"x": 1.5, "y": 2, "z": 4})
+        >>> a.is_PROPc({"x"}, 3, c=1), a.is_PROPc({"x"}, 2, c=1)
+        (True, False)
         """
-        return self.value(own_bundle) >= self.value_proportional_except_c(num_of_agents, c)
+        # Multiplying instead of dividing keeps integer values exact without constructing a Fraction:
+        return self.value(own_bundle) * num_of_agents >= self.value_except_best_c_goods(self.desired_items, c)
 
     def is_PROP(self, own_bundle:Bundle, num_of_agents:int)->bool:
         """
@@ -305,14 +449,21 @@ class MonotoneValuation(Valuation):
         """
         Calculates the agent's value for the given set of goods.
         """
-        bundle = frozenset(bundle)
-        if bundle in self.map_bundle_to_value:
-            return self.map_bundle_to_value[bundle]
-        else:
+        if not isinstance(bundle, frozenset):   # the value_except_* subroutines already pass frozensets.
+            bundle = frozenset(bundle)
+        value = self.map_bundle_to_value.get(bundle)
+        if value is None:
             raise ValueError(f"The value of {bundle} is not specified in the valuation function")
+        return value
+
+    def _is_monotone(self)->bool:
+        return True
+
+    def _canonical_bundle(self, bundle:Bundle)->frozenset:
+        return frozenset(bundle)
 
     def __repr__(self):
-        return f"Monotone valuation on {sorted(self.desired_items)}."
+        return f"Monotone valuation on {self.desired_items_list}."
 
 
 class AdditiveValuation(Valuation):
@@ -405,6 +556,25 @@ class AdditiveValuation(Valuation):
     33
     >>> a.all_items()
     {0, 1, 2, 3}
+
+    >>> ### Evaluate bundles given as numpy arrays of items, or as boolean masks over the items
+    >>> a.value(np.array([1,2]))
+    66
+    >>> a.value(np.array([True,False,True,False]))
+    55
+    >>> AdditiveValuation({"x": 1, "y": 2, "z": 4}).value(np.array(["x","z"]))
+    5
+    >>> AdditiveValuation([2**62, 2**62, 1]).value(np.array([0,1]))
+    9223372036854775808
+
+    >>> ### Boolean values are counted, as in a sum of Python booleans
+    >>> b = AdditiveValuation([True]*4)
+    >>> b.values_of_bundles([{0}, {1,2,3}])
+    [1, 3]
+    >>> b.is_EF1({0}, [{0}, {1,2,3}])
+    False
+    >>> b.is_EFx({0}, [{0}, {1,2,3}])
+    False
     """
     def __init__(self, map_good_to_value, name:str=None, duplicity:int=1):
         """
@@ -427,14 +597,48 @@ class AdditiveValuation(Valuation):
 
         self.map_good_to_value = map_good_to_value
         self._all_items = all_items
+
+        # The values as a numpy array, for evaluating bundles given as arrays of items or boolean masks.
+        # For a list, the index of each item is the item itself; for a dict, it is the item's position in the dict.
+        if isinstance(map_good_to_value, dict):
+            self._map_item_to_index = {item:index for index,item in enumerate(map_good_to_value.keys())}
+            weights = np.asarray(list(map_good_to_value.values()))
+        else:
+            self._map_item_to_index = None
+            weights = np.asarray(map_good_to_value)
+        if weights.dtype.kind == "b":
+            weights = weights.astype(np.int64)   # numpy sums of booleans are logical ORs, whereas `value` counts the True values.
+        if weights.dtype.kind in "iu":
+            total_weight = sum([abs(int(weight)) for weight in weights.tolist()])   # in Python ints, which cannot overflow.
+            if total_weight < 2**31:
+                weights = weights.astype(np.int32)   # every sum of weights fits, and the narrower array is faster to gather and reduce.
+            elif total_weight >= 2**63:
+                weights = weights.astype(object)     # numpy sums could overflow, so the values remain in pure Python.
+        self._weights = weights if weights.dtype.kind in "iuf" else None   # e.g. Fraction values remain in pure Python.
+        # Integer sums do not depend on the order of additions, so numpy sums of integer weights equal the Python sums of `value`.
+        # Float sums may differ in the last bit, so comparisons between bundles use `value` for all bundles.
+        self._has_exact_weights = self._weights is not None and self._weights.dtype.kind in "iu"
+        self._has_float_values = self._weights is not None and not self._has_exact_weights
+        values = map_good_to_value.values() if isinstance(map_good_to_value, dict) else map_good_to_value
+        self._all_values_non_negative = all(value >= 0 for value in values)
         super().__init__(desired_items)
 
+        # The values of the desired items from best to worst, and their prefix sums, for queries about the best c goods:
+        self._desired_values_descending = sorted([self.map_good_to_value[g] for g in self.desired_items_list], reverse=True)
+        self._desired_values_prefix_sums = [0] + list(itertools.accumulate(self._desired_values_descending))
+        self._compiled_value = None   # created by `compile`
+        self._repr_cache = None       # created by `__repr__`
+
     def value(self, bundle:Bundle)->int:
         """
         Calculates the agent's value for the given good or set of goods.
         """
         if bundle is None:
             return 0
+        elif isinstance(bundle, np.ndarray):
+            if self._weights is None:
+                return sum([self.map_good_to_value[g] for g in self._items_of_array(bundle)])
+            return self._weights[self._indices_of_array(bundle)].sum().item()
         elif isinstance(bundle, str):
             if bundle in self.map_good_to_value:
                 return self.map_good_to_value[bundle]
@@ -445,9 +649,189 @@ class AdditiveValuation(Valuation):
         else:                              # individual item
             return self.map_good_to_value[bundle]
 
+    def _indices_of_array(self, bundle:np.ndarray)->np.ndarray:
+        """
+        :param bundle: a numpy array of items, or a boolean mask over the items.
+        :return the indices of the bundle's items in self._weights.
+        """
+        if bundle.dtype == bool:
+            return np.flatnonzero(bundle)
+        elif self._map_item_to_index is None:
+            return bundle.astype(np.intp, copy=False)
+        else:
+            return np.fromiter((self._map_item_to_index[item] for item in bundle.tolist()), dtype=np.intp, count=bundle.size)
+
+    def _items_of_array(self, bundle:np.ndarray)->list:
+        """
+        :param bundle: a numpy array of items, or a boolean mask over the items.
+        :return a list of the bundle's items.
+        """
+        if bundle.dtype != bool:
+            return bundle.tolist()
+        items = list(self.map_good_to_value.keys()) if self._map_item_to_index is not None else range(len(self.map_good_to_value))
+        return [items[index] for index in np.flatnonzero(bundle)]
+
     def all_items(self):
         return self._all_items
 
+    def _indices_of_bundle(self, bundle:Bundle)->list:
+        """
+        :return the indices in self._weights of the items in the given bundle (of any type accepted by `value`).
+        """
+        if bundle is None:
+            return []
+        elif isinstance(bundle, np.ndarray):
+            return self._indices_of_array(bundle).tolist()
+        elif (isinstance(bundle, str) and bundle not in self.map_good_to_value) or (not isinstance(bundle, str) and isinstance(bundle, Iterable)):
+            items = bundle
+        else:                              # individual item
+            items = [bundle]
+        if self._map_item_to_index is None:
+            return list(items)
+        return [self._map_item_to_index[item] for item in items]
+
+    def values_of_bundles(self, bundles:List[Bundle])->list:
+        """
+        Calculates the agent's values for several bundles.
+        The items of all bundles are gathered into a single index array (in CSR-like form),
+        and the values are computed by a single segmented sum of the weights.
+
+        >>> a = AdditiveValuation({"x": 1, "y": 2, "z": 4})
+        >>> a.values_of_bundles([{"x","z"}, set(), "y", "xyz"])
+        [5, 0, 2, 7]
+        >>> AdditiveValuation([Fraction(1,2), 1]).values_of_bundles([{0,1}, {0}])
+        [Fraction(3, 2), Fraction(1, 2)]
+        >>> AdditiveValuation([0.0, 5.028, 0.0, 4.461, 7.882]).values_of_bundles([{1,2,3,4}, {0,1,2,3,4}])
+        [17.371000000000002, 17.371000000000002]
+        """
+        if not self._has_exact_weights:
+            return super().values_of_bundles(bundles)
+        indices = []
+        starts = []
+        for bundle in bundles:
+            starts.append(len(indices))
+            indices.extend(self._indices_of_bundle(bundle))
+        starts = np.array(starts, dtype=np.intp)
+        lengths = np.diff(starts, append=len(indices))
+        values = np.zeros(len(starts), dtype=self._weights.dtype)
+        non_empty = lengths > 0
+        if non_empty.any():   # reduceat sums each segment up to the next start, so empty segments are skipped.
+            values[non_empty] = np.add.reduceat(self._weights[indices], starts[non_empty])
+        return values.tolist()
+
+    def bundle_mask(self, bundle:Bundle)->int:
+        """
+        Converts a bundle to a bitmask, in which bit i represents the item with index i
+        (the item itself for a list valuation; the item's position for a dict valuation).
+
+        >>> AdditiveValuation({"x": 1, "y": 2, "z": 4}).bundle_mask({"x","z"})
+        5
+        """
+        mask = 0
+        for index in self._indices_of_bundle(bundle):
+            mask |= 1 << index
+        return mask
+
+    def compile(self)->Callable[[int], float]:
+        """
+        Specializes the valuation to bundles given as bitmasks (see `bundle_mask`),
+        for experiments that evaluate many bundles over the same items.
+        With numba and at most 63 items, the returned function is a compiled loop over the bits.
+        Otherwise, the values of all 256 subsets of each block of 8 items are precomputed,
+        and a bundle is evaluated by one table lookup per block.
+        :return a function that maps a bitmask to the value of the corresponding bundle.
+
+        >>> a = AdditiveValuation({"x": 1, "y": 2, "z": 4})
+        >>> value_of_mask = a.compile()
+        >>> value_of_mask(a.bundle_mask({"x","z"}))
+        5
+        >>> value_of_mask(0)
+        0
+        >>> AdditiveValuation([Fraction(1,2), 1, Fraction(1,3)]).compile()(0b101)
+        Fraction(5, 6)
+        """
+        if self._compiled_value is not None:
+            return self._compiled_value
+        if _value_of_mask_compiled is not None and self._weights is not None and len(self._weights) <= 63:
+            weights = self._weights
+            self._compiled_value = lambda mask: _value_of_mask_compiled(mask, weights)
+            return self._compiled_value
+        values = list(self.map_good_to_value.values()) if isinstance(self.map_good_to_value, dict) else list(self.map_good_to_value)
+        tables = []
+        for start in range(0, len(values), 8):
+            block = values[start:start+8]
+            table = [0] * (1 << len(block))
+            for subset in range(1, len(table)):
+                lowest_bit = subset & -subset
+                table[subset] = table[subset ^ lowest_bit] + block[lowest_bit.bit_length()-1]
+            tables.append(table)
+
+        def value_of_mask(mask:int):
+            total = 0
+            for table in tables:
+                if not mask:
+                    break
+                total += table[mask & 255]
+                mask >>= 8
+            return total
+
+        self._compiled_value = value_of_mask
+        return value_of_mask
+
+    def __getstate__(self):
+        """
+        The compiled function is a closure that cannot be pickled; it is dropped, and re-created by `compile` when needed.
+
+        >>> import pickle
+        >>> a = AdditiveValuation([1,2,3])
+        >>> value_of_mask = a.compile()
+        >>> pickle.loads(pickle.dumps(a)).compile()(0b110)
+        5
+        """
+        state = self.__dict__.copy()
+        state["_compiled_value"] = None
+        return state
+
+    def is_EF(self, own_bundle:Bundle, all_bundles:List[Bundle])->bool:
+        """
+        Checks whether the current agent finds the given allocation envy-free.
+        With integer weights, the own bundle is evaluated in the same batch as the other bundles;
+        otherwise, the bundles are evaluated one by one by `value`, so that equal bundles get exactly equal values.
+
+        >>> AdditiveValuation([2, 1, 4, 9]).is_EF({1,2,3}, [{1,2,3}, {0}])
+        True
+        >>> AdditiveValuation([2.704, 1.704, 4.591, 9.334]).is_EF({1,2,3}, [{1,2,3}, {0}])
+        True
+        >>> AdditiveValuation([2.704, 1.704, 4.591, 9.334]).is_EF({0,1}, [{0,1}, {2}])
+        False
+        """
+        if not self._has_exact_weights:
+            return super().is_EF(own_bundle, all_bundles)
+        values = self.values_of_bundles([own_bundle] + list(all_bundles))
+        return all(values[0] >= other_value for other_value in values[1:])
+
+    def best_index(self, allocation:List[Bundle])->int:
+        """
+        Returns an index of a bundle that is most-valuable for the agent.
+        The values of all bundles are computed at once, as the product of a bundle-item indicator matrix by the weights.
+
+        >>> a = AdditiveValuation({"x": 1, "y": 2, "z": 3})
+        >>> a.best_index(["xy","z"])
+        0
+        >>> a.best_index([{"y"},{"x","z"},set()])
+        1
+        >>> AdditiveValuation([5,1,1,1]).best_index([[1,2,3],[0],[]])
+        1
+        >>> AdditiveValuation([True,True,True]).best_index([{0},{1,2}])
+        1
+        """
+        if not self._has_exact_weights:   # with float weights, ties must be broken by the same sums as `value`.
+            return super().best_index(allocation)
+        indicator = np.zeros((len(allocation), len(self._weights)), dtype=np.int64)   # counts of items, whatever the dtype of the weights.
+        for index,bundle in enumerate(allocation):
+            np.add.at(indicator[index], self._indices_of_bundle(bundle), 1)   # add.at counts repeated items, like `value`.
+        return int(np.argmax(indicator @ self._weights))
+
     def value_except_best_c_goods(self, bundle:Bundle, c:int=1)->int:
         """
         Calculates the value of the given bundle when the "best" (at most) c goods are removed from it.
@@ -469,10 +853,22 @@ class AdditiveValuation(Valuation):
         0
         >>> a.value_except_best_c_goods(set(), c=1)
         0
+        >>> a.value_except_best_c_goods(np.array(["x","y","z"]), c=1)
+        3
         """
-        if len(bundle) <= c: return 0
-        sorted_bundle = sorted(bundle, key=lambda g: -self.map_good_to_value[g]) # sort the goods from best to worst
-        return self.value(sorted_bundle[c:])  # remove the best c goods
+        if bundle is self.desired_items:   # e.g. in value_proportional_except_c
+            if len(bundle) <= c: return 0
+            if self._has_float_values:
+                return sum(self._desired_values_descending[c:])
+            return self._desired_values_prefix_sums[-1] - self._desired_values_prefix_sums[c]
+        values = self._values_of_bundle_items(bundle)
+        if len(values) <= c: return 0
+        # Only the best c goods are needed, not a full sort:
+        if isinstance(values, np.ndarray):
+            return np.partition(values, len(values)-c-1)[:len(values)-c].sum().item()
+        if self._has_float_values:   # subtracting would round differently from summing the remaining goods.
+            return sum(sorted(values, reverse=True)[c:])
+        return sum(values) - sum(heapq.nlargest(c, values))  # remove the best c goods
 
     def value_except_worst_c_goods(self, bundle:Bundle, c:int=1)->int:
         """
@@ -493,10 +889,27 @@ class AdditiveValuation(Valuation):
         0
         >>> a.value_except_worst_c_goods(set(), c=1)
         0
+        >>> a.value_except_worst_c_goods(np.array(["x","y","z"]), c=1)
+        6
         """
-        if len(bundle) <= c: return 0
-        sorted_bundle = sorted(bundle, key=lambda g: self.map_good_to_value[g])  # sort the goods from worst to best:
-        return self.value(sorted_bundle[c:])  # remove the worst c goods
+        values = self._values_of_bundle_items(bundle)
+        if len(values) <= c: return 0
+        # Only the worst c goods are needed, not a full sort:
+        if isinstance(values, np.ndarray):
+            return np.partition(values, c)[c:].sum().item()
+        if self._has_float_values:   # subtracting would round differently from summing the remaining goods.
+            return sum(sorted(values)[c:])
+        return sum(values) - sum(heapq.nsmallest(c, values))  # remove the worst c goods
+
+    def _values_of_bundle_items(self, bundle:Bundle):
+        """
+        :return the values of the items in the given bundle: a numpy array if the bundle is a numpy array, otherwise a list.
+        """
+        if isinstance(bundle, np.ndarray) and self._weights is not None:
+            return self._weights[self._indices_of_array(bundle)]
+        elif isinstance(bundle, np.ndarray):
+            bundle = self._items_of_array(bundle)
+        return [self.map_good_to_value[g] for g in bundle]
 
 
     def value_of_cth_best_good(self, c:int)->int:
@@ -516,17 +929,115 @@ class AdditiveValuation(Valuation):
         if c > len(self.desired_items):
             return 0
         else:
-            sorted_values = sorted(self.map_good_to_value.values(), reverse=True)
-            return sorted_values[c-1]
+            return self._desired_values_descending[c-1]
+
+    def _can_skip_unenvied_bundles(self)->bool:
+        return self._all_values_non_negative
+
+    def _weights_of_items(self, items:list)->np.ndarray:
+        """
+        :return a numpy array with the values of the given items.
+        """
+        indices = items if self._map_item_to_index is None else [self._map_item_to_index[item] for item in items]
+        return self._weights[np.asarray(indices, dtype=np.intp)]
+
+    def _maximin_partition(self, c:int, items:list)->Tuple[float, List[List[int]]]:
+        """
+        :return (maximin value, list of bundles of indices into `items`), or None if the values of some items are negative.
+        Uses a dynamic program over subsets of the items for up to MMS_DP_MAX_ITEMS items, and a depth-first search with pruning otherwise.
+        """
+        if not all(self.map_good_to_value[item] >= 0 for item in items):
+            return None
+        if self._weights is not None and len(items) <= MMS_DP_MAX_ITEMS:
+            return _maximin_partition(self._weights_of_items(items), c)
+        return _maximin_partition_search([self.map_good_to_value[item] for item in items], c)
+
+    def partition_1_of_c_MMS(self, c: int, items: list) -> List[Bundle]:
+        """
+        Compute a 1-out-of-c MMS partition of the given items.
+        For items with non-negative values, it uses a dynamic program over subsets of items (for up to MMS_DP_MAX_ITEMS items)
+        or a depth-first search with pruning, instead of enumerating all partitions.
+
+        >>> valuation = AdditiveValuation({'a': 5, 'b': 5, 'c': 3, 'd': 4, 'e': 5, 'f': 5})
+        >>> mms_part = valuation.partition_1_of_c_MMS(3, ['a','b','c','d','e','f'])
+        >>> sorted([valuation.value(bundle) for bundle in mms_part])
+        [8, 9, 10]
+        >>> valuation.partition_1_of_c_MMS(4, ['a','b','c'])
+        []
+        >>> valuation = AdditiveValuation(list(range(1,25)))
+        >>> sorted([valuation.value(bundle) for bundle in valuation.partition_1_of_c_MMS(3, list(range(24)))])
+        [100, 100, 100]
+        >>> sorted([len(bundle) for bundle in AdditiveValuation([True]*4).partition_1_of_c_MMS(2, [0,1,2,3])])
+        [2, 2]
+        """
+        items = list(items)
+        if len(items) < c:
+            return []
+        result = self._maximin_partition(c, items)
+        if result is None:
+            return super().partition_1_of_c_MMS(c, items)
+        (_, bundles) = result
+        return [set([items[index] for index in bundle]) for bundle in bundles]
+
+    def value_1_of_c_MMS(self, c:int=1)->int:
+        """
+        Calculates the value of the 1-out-of-c maximin-share ( https://en.wikipedia.org/wiki/Maximin-share ).
+        For up to MMS_DP_MAX_ITEMS desired items, it uses a dynamic program over subsets of items,
+        and for more items, a depth-first search with pruning, instead of enumerating all partitions.
+
+        >>> AdditiveValuation([5, 5, 3, 4, 5, 5]).value_1_of_c_MMS(c=3)
+        8
+        >>> AdditiveValuation([1.5, 2, 4]).value_1_of_c_MMS(c=2)
+        3.5
+        >>> AdditiveValuation([Fraction(1,2), Fraction(3,4), Fraction(5,4)]).value_1_of_c_MMS(c=2)
+        Fraction(5, 4)
+        >>> AdditiveValuation([True]*4).value_1_of_c_MMS(c=2)
+        2
+        """
+        if c > len(self.desired_items):
+            return 0
+        (maximin_value, _) = self._maximin_partition(c, self.desired_items_list)   # the desired items have positive values.
+        return maximin_value
 
     def __repr__(self):
-        if isinstance(self.map_good_to_value,dict):
-            values_as_string = " ".join([f"{k}={v}" for k,v in sorted(self.map_good_to_value.items())])
-        elif isinstance(self.map_good_to_value,list):
-            values_as_string = " ".join([f"v{i}={self.map_good_to_value[i]}" for i in range(len(self.map_good_to_value))])
-        return f"Additive valuation: {values_as_string}."
+        if self._repr_cache is None:   # the values do not change, so the string is built once.
+            if isinstance(self.map_good_to_value,dict):
+                values_as_string = " ".join([f"{k}={v}" for k,v in sorted(self.map_good_to_value.items())])
+            elif isinstance(self.map_good_to_value,list):
+                values_as_string = " ".join([f"v{i}={self.map_good_to_value[i]}" for i in range(len(self.map_good_to_value))])
+            self._repr_cache = f"Additive valuation: {values_as_string}."
+        return self._repr_cache
+
 
 
+def _value_of_mask(mask:int, weights:np.ndarray):
+    """
+    The sum of the weights whose bits are set in the given bitmask; used by `AdditiveValuation.compile` when numba is installed.
+
+    >>> _value_of_mask(5, np.array([1,2,4]))
+    5
+    """
+    total = 0
+    for index in range(weights.size):
+        if (mask >> index) & 1:
+            total += weights[index]
+    return total
+
+_value_of_mask_compiled = njit(cache=True)(_value_of_mask) if njit is not None else None
+
+
+# The number of 1 bits in an int; int.bit_count exists since Python 3.10.
+_popcount = int.bit_count if hasattr(int, "bit_count") else lambda mask: bin(mask).count("1")
+
+class _BundleMask(int):
+    """
+    A bundle of a BinaryValuation represented by the bitmask of its desired goods (see `BinaryValuation._canonical_bundle`).
+    A separate type, so that it is not confused with a bundle that is a single int item.
+    """
+
+def _bundle_size(bundle)->int:
+    return _popcount(bundle) if isinstance(bundle, _BundleMask) else len(bundle)
+
 
 class BinaryValuation(Valuation):
     """
@@ -562,6 +1073,31 @@ class BinaryValuation(Valuation):
         :param duplicity: the number of agents with the same set of desired goods.
         """
         super().__init__(desired_items)
+        # Each desired good gets a bit, so that a bundle can be represented by an int bitmask:
+        self._map_good_to_bit = {good: 1 << index for index,good in enumerate(self.desired_items_list)}
+
+    def bundle_mask(self, bundle:Bundle)->int:
+        """
+        Converts a bundle to a bitmask of the desired goods in it.
+        The bitmask can be evaluated by `value_of_mask`,
+        which is faster when the same bundle is evaluated many times.
+
+        >>> a = BinaryValuation({"x","y","z"})
+        >>> a.bundle_mask({"w","x","z"})
+        5
+        >>> a.value_of_mask(5)
+        2
+        """
+        mask = 0
+        for good in bundle:
+            mask |= self._map_good_to_bit.get(good, 0)
+        return mask
+
+    def value_of_mask(self, mask:int)->int:
+        """
+        Calculates the agent's value for a bundle given as a bitmask returned by `bundle_mask`.
+        """
+        return _popcount(mask)
 
     def value(self, bundle:Bundle)->int:
         """
@@ -580,15 +1116,16 @@ class BinaryValuation(Valuation):
         >>> BinaryValuation(set()).value({"x","y","z"})
         0
         """
-        bundle = set(bundle)
+        if isinstance(bundle, _BundleMask):   # created by _canonical_bundle in the envy-freeness checks.
+            return self.value_of_mask(bundle)
         return len(self.desired_items.intersection(bundle))
 
     def value_except_best_c_goods(self, bundle:Bundle, c:int=1)->int:
-        if len(bundle) <= c: return 0
+        if _bundle_size(bundle) <= c: return 0
         return self.value(bundle) - c
 
     def value_except_worst_c_goods(self, bundle:Bundle, c:int=1)->int:
-        if len(bundle) <= c: return 0
+        if _bundle_size(bundle) <= c: return 0
         return self.value(bundle) - c
 
     def value_of_cth_best_good(self, c:int)->int:
@@ -597,8 +1134,241 @@ class BinaryValuation(Valuation):
     def value_1_of_c_MMS(self, c:int=1)->int:
         return math.floor(self.total_value_cache / c)
 
+    def _can_skip_unenvied_bundles(self)->bool:
+        return True
+
+    def _canonical_bundle(self, bundle:Bundle)->_BundleMask:
+        return _BundleMask(self.bundle_mask(bundle))
+
     def __repr__(self):
-        return f"Binary valuation who wants {sorted(self.desired_items)}."
+        return f"Binary valuation who wants {self.desired_items_list}."
+
+##### Maximin-share partitions for additive valuations
+
+# Above this, the tables of the dynamic program (with 2^m entries) are too large.
+# Without numba, the numpy version of the program is slower than the search already from about 15 items.
+MMS_DP_MAX_ITEMS = 20 if njit is not None else 15
+
+
+def _subset_sums(weights:np.ndarray)->np.ndarray:
+    """
+    :return an array with 2^m entries, whose entry at index `mask` is the total weight of the items whose bits are set in `mask`.
+
+    >>> _subset_sums(np.array([1,2,4]))
+    array([0, 1, 2, 3, 4, 5, 6, 7])
+    """
+    sums = np.zeros(1, dtype=weights.dtype)
+    for weight in weights:
+        sums = np.concatenate([sums, sums + weight])
+    return sums
+
+
+def _cover_with_bundles_loop(weights:np.ndarray, threshold:float, closed:np.ndarray, open_value:np.ndarray, last_item:np.ndarray):
+    """
+    The recurrence of `_cover_with_bundles` as plain loops over the subsets; fills the given arrays in place.
+    Every subset is computed from subsets with one item less, which are smaller numbers, so the subsets are scanned in increasing order.
+    Compiled with numba when it is installed.
+
+    >>> (closed, open_value, last_item) = (np.full(8, -1), np.zeros(8, dtype=int), np.full(8, -1))
+    >>> closed[0] = 0
+    >>> _cover_with_bundles_loop(np.array([3,1,2]), 3, closed, open_value, last_item)
+    >>> closed
+    array([0, 1, 0, 1, 0, 1, 1, 2])
+    """
+    num_of_items = weights.size
+    for mask in range(1, closed.size):
+        for item in range(num_of_items):
+            if (mask >> item) & 1 == 0:
+                continue
+            source = mask ^ (1 << item)
+            new_open_value = open_value[source] + weights[item]
+            new_closed = closed[source]
+            if new_open_value >= threshold:
+                new_closed += 1
+                new_open_value = 0
+            if new_closed > closed[mask] or (new_closed == closed[mask] and new_open_value > open_value[mask]):
+                closed[mask] = new_closed
+                open_value[mask] = new_open_value
+                last_item[mask] = item
+
+_cover_with_bundles_compiled = njit(cache=True)(_cover_with_bundles_loop) if njit is not None else None
+
+
+def _cover_with_bundles(weights:np.ndarray, threshold:float)->Tuple[np.ndarray, np.ndarray]:
+    """
+    A dynamic program for covering with bundles of value at least `threshold`.
+    For each subset of the items (given as a bitmask), it considers all orders of adding its items one by one to a bundle,
+    where a bundle is closed once its value reaches the threshold. Among these orders, it finds one that maximizes 
+    the number of closed bundles, and subject to that, the value of the last (open) bundle.
+    :return (closed, last_item): for each subset, the maximum number of closed bundles, and the last item in an optimal order.
+
+    >>> (closed, last_item) = _cover_with_bundles(np.array([3,1,2]), threshold=3)
+    >>> closed[7]   # the items can be partitioned into two bundles of value at least 3 ({0} and {1,2}).
+    2
+    """
+    num_of_items = len(weights)
+    masks = np.arange(1 << num_of_items)
+    closed = np.full(len(masks), -1)      # -1 means the subset was not reached yet.
+    open_value = np.zeros(len(masks), dtype=weights.dtype)
+    last_item = np.full(len(masks), -1)
+    closed[0] = 0
+    if _cover_with_bundles_compiled is not None:
+        _cover_with_bundles_compiled(weights, threshold, closed, open_value, last_item)
+        return (closed, last_item)
+    popcounts = np.zeros(len(masks), dtype=int)
+    for item in range(num_of_items):
+        popcounts += (masks >> item) & 1
+    layers = np.split(np.argsort(popcounts, kind="stable"), np.cumsum(np.bincount(popcounts))[:-1])
+    # All orders of a subset end with some item; so each layer (subsets of the same size) is computed from the previous layer:
+    for layer in layers[1:]:
+        for item in range(num_of_items):
+            targets = layer[(layer >> item) & 1 == 1]
+            sources = targets ^ (1 << item)
+            new_open_value = open_value[sources] + weights[item]
+            is_closing = new_open_value >= threshold
+            new_closed = closed[sources] + is_closing
+            new_open_value[is_closing] = 0
+            is_better = (new_closed > closed[targets]) | ((new_closed == closed[targets]) & (new_open_value > open_value[targets]))
+            targets = targets[is_better]
+            closed[targets] = new_closed[is_better]
+            open_value[targets] = new_open_value[is_better]
+            last_item[targets] = item
+    return (closed, last_item)
+
+
+def _maximin_partition(weights:np.ndarray, c:int)->Tuple[float, List[List[int]]]:
+    """
+    Finds a partition of the items into c non-empty bundles that maximizes the smallest bundle value.
+    The weights should be non-negative, and there should be at least c items.
+    The maximin value is the sum of some subset of the items, so a binary search over the subset sums 
+    finds the largest threshold such that the items can be covered with c bundles of at least that value.
+    :return (maximin value, list of bundles), where each bundle is a list of item indices.
+
+    >>> _maximin_partition(np.array([1,2,4,0]), c=2)
+    (3, [[3, 2], [1, 0]])
+    >>> _maximin_partition(np.array([5,5,3,4,5,5]), c=3)[0]
+    8
+    """
+    num_of_items = len(weights)
+    full_mask = (1 << num_of_items) - 1
+    sums = _subset_sums(weights)
+    candidates = np.unique(sums[sums*c <= sums[full_mask]])   # the maximin value is at most the total value divided by c.
+    tolerance = 1e-9 if weights.dtype.kind == "f" else 0
+
+    def cover(threshold):
+        return _cover_with_bundles(weights, threshold - tolerance*abs(threshold))
+
+    (low, high) = (0, len(candidates)-1)   # the candidate 0 is always feasible, since there are at least c items.
+    while low < high:
+        middle = (low + high + 1) // 2
+        (closed, _) = cover(candidates[middle])
+        if closed[full_mask] >= c:
+            low = middle
+        else:
+            high = middle - 1
+    maximin_value = candidates[low]
+
+    # Reconstruct an optimal order of the items, and cut it into bundles:
+    (_, last_item) = cover(maximin_value)
+    order = []
+    mask = full_mask
+    while mask:
+        order.append(last_item[mask])
+        mask ^= 1 << last_item[mask]
+    threshold = maximin_value - tolerance*abs(maximin_value)
+    bundles = [[]]
+    bundle_value = 0
+    for item in reversed(order):
+        bundles[-1].append(int(item))
+        bundle_value += weights[item]
+        if bundle_value >= threshold:
+            bundles.append([])
+            bundle_value = 0
+    # The items of the last (open) bundle, and of closed bundles beyond the c-th, are added to the c-th bundle:
+    bundles = bundles[:c-1] + [sum(bundles[c-1:], [])]
+    return (maximin_value.item(), bundles)
+
+
+def _greedy_partition(weights:list, order:list, c:int)->Tuple[float, List[List[int]]]:
+    """
+    The longest-processing-time heuristic: assigns the items in the given order (from the most valuable),
+    each to a bundle with the smallest value so far (preferring empty bundles, so that all bundles are non-empty).
+    :return (the smallest bundle value, list of bundles), where each bundle is a list of item indices.
+
+    >>> _greedy_partition([5,5,3,4,5,5], [0,1,4,5,3,2], c=3)
+    (8, [[0, 5], [1, 3], [4, 2]])
+    """
+    bundle_sums = [0] * c
+    bundles = [[] for _ in range(c)]
+    for item in order:
+        j = min(range(c), key=lambda j: (bundle_sums[j], len(bundles[j]) > 0))
+        bundle_sums[j] += weights[item]
+        bundles[j].append(item)
+    return (min(bundle_sums), bundles)
+
+
+def _maximin_partition_search(weights:list, c:int)->Tuple[float, List[List[int]]]:
+    """
+    Finds a partition of the items into c non-empty bundles that maximizes the smallest bundle value,
+    by a depth-first search over the assignments of items to bundles, for instances that are too large for `_maximin_partition`.
+    The items are assigned from the most valuable to the least valuable. A branch is pruned when it cannot beat the best partition found so far:
+    the k smallest bundles can gain at most the remaining value, so the smallest bundle value is at most (their sum + remaining) / k.
+    The search starts from the greedy partition of `_greedy_partition`, so that pruning is effective from the first branch.
+    The weights should be non-negative, and there should be at least c items.
+    :return (maximin value, list of bundles), where each bundle is a list of item indices.
+
+    >>> _maximin_partition_search([1,2,4,0], c=2)
+    (3, [[2], [1, 0, 3]])
+    >>> _maximin_partition_search([5,5,3,4,5,5], c=3)[0]
+    8
+    """
+    order = sorted(range(len(weights)), key=lambda item: -weights[item])
+    remaining_values = [0] * (len(order)+1)   # remaining_values[i] = the total value of the items order[i:].
+    for i in reversed(range(len(order))):
+        remaining_values[i] = remaining_values[i+1] + weights[order[i]]
+    bundle_sums = [0] * c
+    bundles = [[] for _ in range(c)]
+    (best_value, best_bundles) = _greedy_partition(weights, order, c)
+
+    # With integer weights, the smallest bundle value is an integer, so the bound can be rounded down:
+    integral = all(isinstance(weight, (int, np.integer)) for weight in weights)
+
+    def can_improve(i:int)->bool:
+        smallest_sums = 0
+        for k,bundle_sum in enumerate(sorted(bundle_sums), start=1):
+            smallest_sums += bundle_sum
+            if (smallest_sums + remaining_values[i] < (best_value+1) * k) if integral else (smallest_sums + remaining_values[i] <= best_value * k):
+                return False
+        return True
+
+    def search(i:int, num_of_used_bundles:int):
+        nonlocal best_value, best_bundles
+        if len(order) - i < c - num_of_used_bundles:
+            return   # some bundle would remain empty.
+        if i == len(order):
+            if min(bundle_sums) > best_value:
+                best_value = min(bundle_sums)
+                best_bundles = [list(bundle) for bundle in bundles]
+            return
+        if not can_improve(i):
+            return
+        item = order[i]
+        tried_sums = set()   # adding the item to either of two non-empty bundles with the same sum gives equivalent branches.
+        for j in range(min(num_of_used_bundles+1, c)):
+            if j < num_of_used_bundles:
+                if bundle_sums[j] in tried_sums:
+                    continue
+                tried_sums.add(bundle_sums[j])
+            bundle_sums[j] += weights[item]
+            bundles[j].append(item)
+            search(i+1, max(num_of_used_bundles, j+1))
+            bundle_sums[j] -= weights[item]
+            bundles[j].pop()
+
+    search(0, 0)
+    return (best_value, best_bundles)
+
+
 
 if __name__ == "__main__":
     import doctest
@@ -27,7 +27,7 @@ with open(path.join(here, 'README.md'), encoding='utf-8') as f:
     #     file = builtins.open(filename, mode, buffering)
     # FileNotFoundError: [Errno 2] No such file or directory: '/tmp/pip-req-build-kwpxjwjf/requirements.txt'
 
-requirements = ["numpy","cvxpy","networkx","matplotlib"]
+requirements = ["numpy","scipy","cvxpy","networkx","matplotlib"]
 
 setup(
     name='fairpy',  # Required. Enables intallation with "pip install fairpy".
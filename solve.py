@@ -14,22 +14,23 @@ DEFAULT_SOLVERS=[cvxpy.XPRESS, cvxpy.OSQP, cvxpy.SCS]
 import logging
 logger = logging.getLogger(__name__)
 
-def solve(problem:cvxpy.Problem, solvers:list=DEFAULT_SOLVERS):
+def solve(problem:cvxpy.Problem, solvers:list=DEFAULT_SOLVERS, **solver_options):
 	"""
 	Try to solve the given cvxpy problem using the given solvers, in order, until one succeeds.
     See here https://www.cvxpy.org/tutorial/advanced/index.html for a list of supported solvers.
+	:param solver_options: passed to problem.solve, e.g. warm_start=True when the same problem is solved repeatedly with different parameter values.
 	"""
 	is_solved=False
 	for solver in solvers[:-1]:  # Try the first n-1 solvers.
 		try:
-			problem.solve(solver=solver)
+			problem.solve(solver=solver, **solver_options)
 			logger.info("Solver %s succeeds",solver)
 			is_solved = True
 			break
 		except cvxpy.SolverError as err:
 			logger.info("Solver %s fails: %s", solver, err)
 	if not is_solved:
-		problem.solve(solver=solvers[-1])   # If the first n-1 fail, try the last one.
+		problem.solve(solver=solvers[-1], **solver_options)   # If the first n-1 fail, try the last one.
 	if problem.status == "infeasible":
 		raise ValueError("Problem is infeasible")
 	elif problem.status == "unbounded":